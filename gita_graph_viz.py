@@ -2,15 +2,38 @@ import streamlit as st
 import streamlit.components.v1 as components
 import networkx as nx
 from pyvis.network import Network
-import tempfile
-import os
 from typing import Dict, List, Set, Tuple, Optional
-from collections import defaultdict
+from collections import defaultdict, Counter
+import functools
+import heapq
+import itertools
+import math
+import operator
+import weakref
 import json
 import base64
-from io import StringIO
+from io import StringIO, BytesIO
 import pandas as pd
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import rustworkx as rx
+    RUSTWORKX_AVAILABLE = True
+except ImportError:
+    RUSTWORKX_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # Color scheme for different node types and schools
 NODE_COLORS = {
     'verse': '#FF6B6B',      # Coral red
@@ -33,6 +56,106 @@ SCHOOL_COLORS = {
     'default': '#95A5A6'            # Gray
 }
 
+# Visual properties for knowledge graph edge types
+EDGE_PROPS = {
+    'MENTIONS': {'color': '#4CAF50', 'width': 2, 'style': 'solid'},
+    'COMMENTS_ON': {'color': '#2196F3', 'width': 3, 'style': 'solid'},
+    'BELONGS_TO_SCHOOL': {'color': '#FF9800', 'width': 2, 'style': 'dashed'},
+    'WRITTEN_BY': {'color': '#9C27B0', 'width': 2, 'style': 'dotted'},
+    'SUBSTITUTED_BY': {'color': '#F44336', 'width': 2, 'style': 'dotted'}
+}
+
+DEFAULT_EDGE_PROPS = {'color': '#666666', 'width': 1, 'style': 'solid'}
+
+# Tooltip HTML per node type, filled from node attributes (missing keys render empty)
+TOOLTIP_TEMPLATES = {
+    'verse': "<b>{title}</b><br><i>{_tooltip_shloka}...</i><br>{_tooltip_en}...",
+    'concept': "<b>{title}</b><br>{_tooltip_meaning}...",
+    'commentary': "<b>{title}</b><br>Author: {author}<br>{_tooltip_text}..."
+}
+
+# Graphs rendered through _cached_viz, looked up by id()
+_GRAPHS = weakref.WeakValueDictionary()
+
+def _register_graph(graph: nx.Graph) -> int:
+    """Register a graph for id-keyed caches, dropping stale entries when a new object takes an id"""
+    graph_id = id(graph)
+    if _GRAPHS.get(graph_id) is not graph:
+        _cached_viz.cache_clear()
+        _full_neighborhood.cache_clear()
+        _GRAPHS[graph_id] = graph
+    return graph_id
+
+# rustworkx mirrors of NetworkX graphs used for neighborhood queries, keyed by graph object
+_RX_MIRRORS = weakref.WeakKeyDictionary()
+
+def _rx_mirror(graph: nx.Graph):
+    """Return a (PyGraph, id->index) mirror of a NetworkX graph, building it on first use"""
+    mirror = _RX_MIRRORS.get(graph)
+    if mirror is None:
+        rx_graph = rx.PyGraph(multigraph=False)
+        node_ids = list(graph.nodes)
+        id_to_idx = dict(zip(node_ids, rx_graph.add_nodes_from(node_ids)))
+        rx_graph.add_edges_from_no_data([(id_to_idx[s], id_to_idx[t]) for s, t in graph.edges])
+        mirror = (rx_graph, id_to_idx)
+        _RX_MIRRORS[graph] = mirror
+    return mirror
+
+# Subgraphs at or above this size are rendered with Cytoscape.js instead of pyvis/vis.js
+CYTOSCAPE_NODE_THRESHOLD = 100
+
+CYTOSCAPE_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="https://unpkg.com/cytoscape/dist/cytoscape.min.js"></script>
+<style>
+  body { margin: 0; background: #1e1e1e; font-family: sans-serif; }
+  #cy { width: 100%; height: 400px; }
+  #cy-tooltip { color: white; font-size: 12px; padding: 4px 8px; min-height: 1.5em; }
+</style>
+</head>
+<body>
+<div id="cy"></div>
+<div id="cy-tooltip"></div>
+<script>
+  var cy = cytoscape({
+    container: document.getElementById('cy'),
+    elements: __CY_ELEMENTS__,
+    layout: { name: 'preset' },
+    renderer: { name: 'canvas' },
+    style: [
+      { selector: 'node', style: {
+          'background-color': 'data(color)',
+          'label': 'data(label)',
+          'width': 'data(size)',
+          'height': 'data(size)',
+          'color': 'white',
+          'font-size': 12
+      } },
+      { selector: 'edge', style: { 'line-color': 'data(color)', 'width': 2 } }
+    ]
+  });
+  var tooltip = document.getElementById('cy-tooltip');
+  cy.on('mouseover', 'node', function (evt) { tooltip.innerHTML = evt.target.data('title'); });
+  cy.on('mouseout', 'node', function () { tooltip.innerHTML = ''; });
+</script>
+</body>
+</html>
+"""
+
+# Column layout for exported node/edge tables
+NODE_EXPORT_COLUMNS = [
+    'id', 'type', 'label', 'title', 'size', 'color',
+    'shloka', 'transliteration',
+    'meaning', 'school', 'author', 'text'
+]
+
+EDGE_EXPORT_COLUMNS = ['source', 'target', 'type', 'weight', 'color', 'style', 'attributes']
+
+# Graphs above this size need an explicit opt-in before JSON is serialized
+JSON_EXPORT_NODE_LIMIT = 2000
+
 class GitaGraphVisualizer:
     def __init__(self, kg, search_engine):
         self.kg = kg
@@ -44,26 +167,28 @@ class GitaGraphVisualizer:
     def build_knowledge_graph(self, limit_nodes: int = 500):
         """Build NetworkX graph from knowledge graph data"""
         self.graph.clear()
+        _cached_viz.cache_clear()
+        _full_neighborhood.cache_clear()
+        _RX_MIRRORS.pop(self.graph, None)
 
         # Strategy: Add ALL nodes that are referenced by edges to avoid missing node issues
         nodes_to_add = set()
 
         # Strategy: Prioritize nodes by importance and edge connectivity
-        node_importance = {}
+        node_importance = Counter()
 
         if hasattr(self.kg, 'edges') and self.kg.edges:
             # Count how many edges each node participates in
             for edge in self.kg.edges:
-                node_importance[edge.source] = node_importance.get(edge.source, 0) + 1
-                node_importance[edge.target] = node_importance.get(edge.target, 0) + 1
-                # Add ALL nodes referenced by edges to ensure no missing nodes
-                nodes_to_add.add(edge.source)
-                nodes_to_add.add(edge.target)
+                node_importance[edge.source] += 1
+                node_importance[edge.target] += 1
+            # Add ALL nodes referenced by edges to ensure no missing nodes
+            nodes_to_add = set(node_importance)
 
-            # If we have too many nodes, prioritize by importance
+            # If we have too many nodes, prioritize by importance (only pay for selection when truncating)
             if len(nodes_to_add) > limit_nodes:
-                sorted_nodes = sorted(node_importance.items(), key=lambda x: x[1], reverse=True)
-                nodes_to_add = set([node for node, count in sorted_nodes[:limit_nodes]])
+                top_nodes = heapq.nlargest(limit_nodes, node_importance.items(), key=operator.itemgetter(1))
+                nodes_to_add = set(dict(top_nodes))
                 # st.info(f"Limited to top {limit_nodes} most connected nodes out of {len(node_importance)} total")
             # else:
             #     # st.info(f"Adding all {len(nodes_to_add)} nodes referenced by edges")
@@ -71,9 +196,9 @@ class GitaGraphVisualizer:
         # If no edges, fall back to adding sample nodes
         if not nodes_to_add:
             # Add a sample of each type
-            verse_sample = list(self.kg.verses.keys())[:50]
-            concept_sample = list(self.kg.concepts.keys())[:100]
-            commentary_sample = list(self.kg.commentaries.keys())[:50]
+            verse_sample = list(itertools.islice(self.kg.verses, 50))
+            concept_sample = list(itertools.islice(self.kg.concepts, 100))
+            commentary_sample = list(itertools.islice(self.kg.commentaries, 50))
 
             for verse_id in verse_sample:
                 nodes_to_add.add(f"verse:{verse_id}")
@@ -96,10 +221,10 @@ class GitaGraphVisualizer:
                     type='verse',
                     title=f"Chapter {verse.chapter}, Verse {verse.verse}",
                     label=f"BG {verse.chapter}.{verse.verse}",
-                    translations=verse.translations,
                     transliteration=verse.transliteration,
                     shloka=verse.shloka,
-                    word_meaning=verse.word_meaning,
+                    _tooltip_shloka=verse.shloka[:50],
+                    _tooltip_en=verse.translations.get('english', '')[:100],
                     size=15,
                     color=NODE_COLORS['verse']
                 )
@@ -118,6 +243,7 @@ class GitaGraphVisualizer:
                     title=f"Concept: {concept_term}",
                     label=concept_term[:20] + "..." if len(concept_term) > 20 else concept_term,
                     meaning=concept.meaning,
+                    _tooltip_meaning=concept.meaning[:100],
                     size=10,
                     color=NODE_COLORS['concept']
                 )
@@ -127,24 +253,37 @@ class GitaGraphVisualizer:
         # st.info(f"Found {concept_nodes_in_set} concept nodes in edge set out of {len(self.kg.concepts)} total concepts")
                     
         # Add commentary nodes that are in our set
-        for commentary_id, commentary in self.kg.commentaries.items():
-            commentary_node_id = f"commentary:{commentary_id}"
-            if commentary_node_id in nodes_to_add and commentary.text.strip():
-                school_color = SCHOOL_COLORS.get(commentary.school, SCHOOL_COLORS['default'])
-
-                self.graph.add_node(
-                    commentary_node_id,
-                    type='commentary',
-                    title=f"Commentary by {commentary.school}",
-                    label=f"{commentary.school[:15]}...",
-                    school=commentary.school,
-                    author=commentary.original_author,
-                    text=commentary.text[:200] + "..." if len(commentary.text) > 200 else commentary.text,
-                    size=8,
-                    color=school_color
-                )
-                node_count += 1
-                nodes_added_by_type['commentary'] += 1
+        selected_commentaries = [
+            (f"commentary:{commentary_id}", commentary)
+            for commentary_id, commentary in self.kg.commentaries.items()
+            if f"commentary:{commentary_id}" in nodes_to_add and commentary.text.strip()
+        ]
+        # Resolve school colors in one vectorized pass
+        school_colors = (
+            pd.Series([commentary.school for _, commentary in selected_commentaries], dtype=object)
+            .map(SCHOOL_COLORS)
+            .fillna(SCHOOL_COLORS['default'])
+            .tolist()
+        )
+        self.graph.add_nodes_from(
+            (
+                commentary_node_id,
+                {
+                    'type': 'commentary',
+                    'title': f"Commentary by {commentary.school}",
+                    'label': f"{commentary.school[:15]}...",
+                    'school': commentary.school,
+                    'author': commentary.original_author,
+                    'text': commentary.text[:200] + "..." if len(commentary.text) > 200 else commentary.text,
+                    '_tooltip_text': commentary.text[:100],
+                    'size': 8,
+                    'color': school_color
+                }
+            )
+            for (commentary_node_id, commentary), school_color in zip(selected_commentaries, school_colors)
+        )
+        node_count += len(selected_commentaries)
+        nodes_added_by_type['commentary'] += len(selected_commentaries)
 
         # Add school nodes that are in our set
         for school in self.kg.schools:
@@ -188,40 +327,36 @@ class GitaGraphVisualizer:
         # else:
         #     st.warning("No edges found in knowledge graph - using legacy edge system")
 
-        edges_added = 0
         missing_sources = []
         missing_targets = []
 
+        # Collect edges and insert them in one batch
+        has = self.graph.__contains__
+        batch = []
         for edge in kg_edges:
-            if self.graph.has_node(edge.source) and self.graph.has_node(edge.target):
-                # Map edge types to visual properties
-                edge_props = {
-                    'MENTIONS': {'color': '#4CAF50', 'width': 2, 'style': 'solid'},
-                    'COMMENTS_ON': {'color': '#2196F3', 'width': 3, 'style': 'solid'},
-                    'BELONGS_TO_SCHOOL': {'color': '#FF9800', 'width': 2, 'style': 'dashed'},
-                    'WRITTEN_BY': {'color': '#9C27B0', 'width': 2, 'style': 'dotted'},
-                    'SUBSTITUTED_BY': {'color': '#F44336', 'width': 2, 'style': 'dotted'}
-                }
-
-                props = edge_props.get(edge.edge_type, {'color': '#666666', 'width': 1, 'style': 'solid'})
-
-                self.graph.add_edge(
+            if has(edge.source) and has(edge.target):
+                props = EDGE_PROPS.get(edge.edge_type, DEFAULT_EDGE_PROPS)
+                batch.append((
                     edge.source,
                     edge.target,
-                    type=edge.edge_type,
-                    weight=props['width'],
-                    color=props['color'],
-                    style=props['style'],
-                    attributes=edge.attributes
-                )
-                edges_added += 1
+                    {
+                        'type': edge.edge_type,
+                        'weight': props['width'],
+                        'color': props['color'],
+                        'style': props['style'],
+                        'attributes': edge.attributes
+                    }
+                ))
             else:
                 # Count missing nodes for summary
-                if not self.graph.has_node(edge.source):
+                if not has(edge.source):
                     missing_sources.append(edge.source)
-                if not self.graph.has_node(edge.target):
+                if not has(edge.target):
                     missing_targets.append(edge.target)
 
+        self.graph.add_edges_from(batch)
+        edges_added = len(batch)
+
         # st.info(f"Successfully added {edges_added} edges out of {len(kg_edges)} total edges")
 
         # Show summary of missing nodes
@@ -244,19 +379,19 @@ class GitaGraphVisualizer:
             # Legacy concept to verse edges
             for concept_term, concept in self.kg.concepts.items():
                 concept_node_id = f"concept:{concept_term}"
-                if self.graph.has_node(concept_node_id):
+                if concept_node_id in self.graph:
                     for verse_id in concept.mentioned_in:
                         verse_node_id = f"verse:{verse_id}"
-                        if self.graph.has_node(verse_node_id):
+                        if verse_node_id in self.graph:
                             self.graph.add_edge(concept_node_id, verse_node_id,
                                               type='mentions', weight=1)
 
             # Legacy commentary to verse edges
             for commentary_id, commentary in self.kg.commentaries.items():
                 commentary_node_id = f"commentary:{commentary_id}"
-                if self.graph.has_node(commentary_node_id):
+                if commentary_node_id in self.graph:
                     verse_node_id = f"verse:{commentary.verse_id}"
-                    if self.graph.has_node(verse_node_id):
+                    if verse_node_id in self.graph:
                         self.graph.add_edge(commentary_node_id, verse_node_id,
                                           type='comments_on', weight=1)
 
@@ -267,28 +402,17 @@ class GitaGraphVisualizer:
         if not center_nodes or not self.graph.nodes():
             return nx.Graph()
             
-        subgraph_nodes = set()
-        
-        # Add center nodes
-        for node in center_nodes:
-            if node in self.graph:
-                subgraph_nodes.add(node)
-        
-        # Add neighbors within max_hops
-        for hop in range(max_hops):
-            if len(subgraph_nodes) >= max_nodes:
-                break
-                
-            current_nodes = list(subgraph_nodes)
-            for node in current_nodes:
-                if len(subgraph_nodes) >= max_nodes:
-                    break
-                    
-                neighbors = list(self.graph.neighbors(node))
-                for neighbor in neighbors[:5]:  # Limit neighbors per node
-                    if len(subgraph_nodes) >= max_nodes:
-                        break
-                    subgraph_nodes.add(neighbor)
+        # Full (uncapped) neighborhood is cached per query; only the trim below reruns on slider changes
+        graph_id = _register_graph(self.graph)
+        subgraph_nodes = _full_neighborhood(graph_id, tuple(center_nodes), max_hops)
+
+        # Keep the center nodes plus the best-connected neighbors when over budget
+        if len(subgraph_nodes) > max_nodes:
+            centers = {node for node in center_nodes if node in self.graph}
+            neighbors = subgraph_nodes - centers
+            subgraph_nodes = centers.union(
+                heapq.nlargest(max(max_nodes - len(centers), 0), neighbors, key=self.graph.degree)
+            )
         
         return self.graph.subgraph(subgraph_nodes).copy()
     
@@ -296,18 +420,17 @@ class GitaGraphVisualizer:
         """Create interactive visualization centered around search results"""
         if not search_results:
             return ""
-            
-        # Get center nodes from search results
-        center_nodes = []
-        query_paths = []
         
-        for result in search_results[:3]:  # Limit to top 3 results
-            verse_node_id = f"verse:{result.verse.id}"
-            center_nodes.append(verse_node_id)
-            
-            # Track query paths for highlighting
-            for path in result.provenance_path:
-                query_paths.append(path)
+        # Register the graph so the cached renderer can resolve it by id
+        graph_id = _register_graph(self.graph)
+        
+        # Limit to top 3 results
+        verse_ids = tuple(result.verse.id for result in search_results[:3])
+        return _cached_viz(graph_id, verse_ids, max_nodes)
+    
+    def _render_verse_centric_html(self, verse_ids: Tuple[str, ...], max_nodes: int) -> str:
+        """Render the verse-centric subgraph around the given verse ids as HTML"""
+        center_nodes = [f"verse:{verse_id}" for verse_id in verse_ids]
         
         # Create subgraph
         subgraph = self.get_subgraph_around_nodes(center_nodes, max_hops=2, max_nodes=max_nodes)
@@ -315,28 +438,12 @@ class GitaGraphVisualizer:
         if not subgraph.nodes():
             return ""
         
-        # Create Pyvis network
-        net = Network(height="400px", width="100%", bgcolor="#1e1e1e", font_color="white")
-        net.set_options("""
-        {
-          "physics": {
-            "enabled": true,
-            "stabilization": {"iterations": 100}
-          },
-          "layout": {
-            "improvedLayout": true
-          },
-          "interaction": {
-            "hover": true,
-            "tooltipDelay": 300
-          }
-        }
-        """)
+        # Precompute a static layout server-side so the browser skips physics simulation
+        pos = nx.spring_layout(subgraph, seed=42, iterations=50, k=1 / math.sqrt(len(subgraph)))
         
-        # Add nodes to Pyvis
+        # Style nodes
+        styled_nodes = []
         for node_id, data in subgraph.nodes(data=True):
-            node_type = data.get('type', 'unknown')
-            
             # Create tooltip
             tooltip = self._create_node_tooltip(node_id, data)
             
@@ -348,16 +455,16 @@ class GitaGraphVisualizer:
                 size = data.get('size', 10)
                 color = data.get('color', '#95A5A6')
             
-            net.add_node(
-                node_id,
-                label=data.get('label', node_id),
-                title=tooltip,
-                size=size,
-                color=color,
-                font={'size': 12}
-            )
+            styled_nodes.append({
+                'id': node_id,
+                'label': data.get('label', node_id),
+                'title': tooltip,
+                'size': size,
+                'color': color
+            })
         
-        # Add edges
+        # Style edges
+        styled_edges = []
         for source, target, data in subgraph.edges(data=True):
             edge_type = data.get('type', 'connected')
             edge_color = '#666666'
@@ -367,66 +474,62 @@ class GitaGraphVisualizer:
             elif edge_type == 'comments_on':
                 edge_color = '#45B7D1'
                 
-            net.add_edge(source, target, color=edge_color, width=2)
+            styled_edges.append({'source': source, 'target': target, 'color': edge_color})
         
-        # Generate HTML
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.html', delete=False) as f:
-            temp_file_path = f.name
-
-        try:
-            net.save_graph(temp_file_path)
-            with open(temp_file_path, 'r', encoding='utf-8') as file:
-                html_content = file.read()
-        finally:
-            # Safe file deletion with retry
-            try:
-                os.unlink(temp_file_path)
-            except (PermissionError, FileNotFoundError):
-                # If we can't delete immediately, schedule for later cleanup
-                import atexit
-                atexit.register(lambda: self._safe_delete(temp_file_path))
+        # Large subgraphs render on canvas via Cytoscape.js instead of vis.js
+        if len(subgraph) >= CYTOSCAPE_NODE_THRESHOLD:
+            return _render_cytoscape(styled_nodes, styled_edges, pos)
+        
+        # Create Pyvis network
+        net = Network(height="400px", width="100%", bgcolor="#1e1e1e", font_color="white")
+        net.set_options("""
+        {
+          "physics": {
+            "enabled": false
+          },
+          "layout": {
+            "randomSeed": 42
+          },
+          "interaction": {
+            "hover": true,
+            "tooltipDelay": 300
+          }
+        }
+        """)
+        
+        # Inject nodes/edges straight into pyvis' lists; the schema is ours so add_node validation is redundant
+        net.nodes.extend([
+            {
+                'id': node['id'],
+                'label': node['label'],
+                'title': node['title'],
+                'shape': 'dot',
+                'size': node['size'],
+                'color': node['color'],
+                'font': {'size': 12, 'color': 'white'},
+                'x': float(pos[node['id']][0]) * 1000,
+                'y': float(pos[node['id']][1]) * 1000,
+                'physics': False,
+                'fixed': True
+            }
+            for node in styled_nodes
+        ])
+        net.edges.extend([
+            {'from': edge['source'], 'to': edge['target'], 'color': edge['color'], 'width': 2}
+            for edge in styled_edges
+        ])
+        
+        # Generate HTML directly in memory (no temp file round-trip)
+        html_content = net.generate_html(notebook=False)
 
         return html_content
 
-    def _safe_delete(self, file_path: str):
-        """Safely delete a file with retry logic"""
-        import time
-        for attempt in range(3):
-            try:
-                if os.path.exists(file_path):
-                    os.unlink(file_path)
-                break
-            except (PermissionError, FileNotFoundError):
-                if attempt < 2:
-                    time.sleep(0.1)  # Wait a bit and retry
-                # If all attempts fail, just ignore - the temp file will be cleaned up by the OS eventually
-
     def _create_node_tooltip(self, node_id: str, data: dict) -> str:
         """Create detailed tooltip for graph nodes"""
-        node_type = data.get('type', 'unknown')
-        
-        if node_type == 'verse':
-            tooltip = f"<b>{data.get('title', 'Verse')}</b><br>"
-            if 'shloka' in data:
-                tooltip += f"<i>{data['shloka'][:50]}...</i><br>"
-            if 'translations' in data and 'english' in data['translations']:
-                tooltip += f"{data['translations']['english'][:100]}..."
-                
-        elif node_type == 'concept':
-            tooltip = f"<b>{data.get('title', 'Concept')}</b><br>"
-            if 'meaning' in data:
-                tooltip += f"{data['meaning'][:100]}..."
-                
-        elif node_type == 'commentary':
-            tooltip = f"<b>{data.get('title', 'Commentary')}</b><br>"
-            if 'author' in data:
-                tooltip += f"Author: {data['author']}<br>"
-            if 'text' in data:
-                tooltip += f"{data['text'][:100]}..."
-        else:
-            tooltip = f"<b>{node_id}</b>"
-            
-        return tooltip
+        template = TOOLTIP_TEMPLATES.get(data.get('type'))
+        if template is None:
+            return f"<b>{node_id}</b>"
+        return template.format_map(defaultdict(str, data))
     
 
     
@@ -444,17 +547,91 @@ class GitaGraphVisualizer:
             traces.append(trace)
         return traces
 
+def _render_cytoscape(nodes: List[Dict], edges: List[Dict], pos: Dict) -> str:
+    """Render styled nodes/edges with a precomputed layout as a Cytoscape.js canvas page"""
+    elements = {
+        'nodes': [
+            {
+                'data': {
+                    'id': node['id'],
+                    'label': node['label'],
+                    'title': node['title'],
+                    'size': node['size'],
+                    'color': node['color']
+                },
+                'position': {
+                    'x': float(pos[node['id']][0]) * 1000,
+                    'y': float(pos[node['id']][1]) * 1000
+                }
+            }
+            for node in nodes
+        ],
+        'edges': [
+            {'data': {'source': edge['source'], 'target': edge['target'], 'color': edge['color']}}
+            for edge in edges
+        ]
+    }
+    # Keep "</script>" inside string data from closing the inline script block
+    elements_json = json.dumps(elements, ensure_ascii=False).replace("</", "<\\/")
+    return CYTOSCAPE_TEMPLATE.replace("__CY_ELEMENTS__", elements_json)
+
+@st.cache_resource(show_spinner=False)
+def _build_kg_graph(kg_id: int, _kg, limit_nodes: int) -> nx.Graph:
+    """Build the full knowledge graph once per kg object and reuse it across reruns"""
+    builder = GitaGraphVisualizer(_kg, None)
+    builder.build_knowledge_graph(limit_nodes=limit_nodes)
+    return builder.graph
+
+@functools.lru_cache(maxsize=64)
+def _full_neighborhood(graph_id: int, center_nodes: Tuple[str, ...], max_hops: int) -> frozenset:
+    """Return every node within max_hops of any center node (no node cap)"""
+    graph = _GRAPHS.get(graph_id)
+    if graph is None:
+        return frozenset()
+
+    neighborhood = set()
+    if RUSTWORKX_AVAILABLE:
+        rx_graph, id_to_idx = _rx_mirror(graph)
+        for node in center_nodes:
+            idx = id_to_idx.get(node)
+            if idx is None:
+                continue
+            seen = {idx}
+            frontier = {idx}
+            for _ in range(max_hops):
+                reached = set()
+                for i in frontier:
+                    reached.update(rx_graph.neighbors(i))
+                frontier = reached - seen
+                seen |= frontier
+            neighborhood.update(rx_graph[i] for i in seen)
+    else:
+        for node in center_nodes:
+            if node in graph:
+                neighborhood.update(nx.single_source_shortest_path_length(graph, node, cutoff=max_hops))
+    return frozenset(neighborhood)
+
+@functools.lru_cache(maxsize=64)
+def _cached_viz(graph_id: int, verse_ids: Tuple[str, ...], max_nodes: int) -> str:
+    """Cache verse-centric HTML keyed on graph identity, center verse ids and node budget"""
+    graph = _GRAPHS.get(graph_id)
+    if graph is None:
+        return ""
+    renderer = GitaGraphVisualizer(None, None)
+    renderer.graph = graph
+    return renderer._render_verse_centric_html(verse_ids, max_nodes)
+
+@st.fragment
 def render_graph_visualization_panel(kg, search_results, current_query=""):
-    """Main function to render graph visualizations in Streamlit"""
+    """Main function to render graph visualizations in Streamlit (reruns as an isolated fragment)"""
     if not search_results:
         return
         
     visualizer = GitaGraphVisualizer(kg, None)
     
-    # Build knowledge graph if needed
-    if visualizer.graph.number_of_nodes() == 0:
-        with st.spinner("Building knowledge graph..."):
-            visualizer.build_knowledge_graph(limit_nodes=1000)  # Increased limit
+    # Build knowledge graph once per session (cached across reruns)
+    with st.spinner("Building knowledge graph..."):
+        visualizer.graph = _build_kg_graph(id(kg), kg, 1000)  # Increased limit
     
     # Graph Visualization Section
     st.subheader("🌐 Knowledge Graph Visualization")
@@ -495,6 +672,18 @@ def render_graph_visualization_panel(kg, search_results, current_query=""):
     
     # Legend
 
+@st.cache_resource(show_spinner=False)
+def _commentary_indexes(kg_id: int, _kg) -> Tuple[Dict[str, List], Dict[str, List]]:
+    """Index commentaries by school and by (original or substitute) author once per kg"""
+    by_school = defaultdict(list)
+    by_author = defaultdict(list)
+    for commentary in _kg.commentaries.values():
+        by_school[commentary.school].append(commentary)
+        for author in {commentary.original_author, commentary.substitute_author}:
+            if author:
+                by_author[author].append(commentary)
+    return dict(by_school), dict(by_author)
+
 def render_node_details_panel(kg, selected_node_id: str = None):
     """Render detailed information panel for selected graph node"""
     if not selected_node_id:
@@ -522,7 +711,7 @@ def render_node_details_panel(kg, selected_node_id: str = None):
             
             if verse.word_meaning:
                 st.markdown("**Word Meanings:**")
-                for term, meaning in list(verse.word_meaning.items())[:5]:
+                for term, meaning in itertools.islice(verse.word_meaning.items(), 5):
                     st.markdown(f"• **{term}:** {meaning}")
                     
             # Export button
@@ -539,7 +728,7 @@ def render_node_details_panel(kg, selected_node_id: str = None):
             
             if concept.mentioned_in:
                 st.markdown("**Related Verses:**")
-                for verse_id in concept.mentioned_in[:5]:
+                for verse_id in itertools.islice(concept.mentioned_in, 5):
                     verse = kg.verses.get(verse_id)
                     if verse:
                         st.markdown(f"• Chapter {verse.chapter}, Verse {verse.verse}")
@@ -562,12 +751,13 @@ def render_node_details_panel(kg, selected_node_id: str = None):
     elif node_type == 'school':
         st.markdown(f"**School:** {node_key}")
         # Show commentaries from this school
-        school_commentaries = [c for c in kg.commentaries.values() if c.school == node_key]
+        by_school, _ = _commentary_indexes(id(kg), kg)
+        school_commentaries = by_school.get(node_key, [])
         st.markdown(f"**Total Commentaries:** {len(school_commentaries)}")
 
         if school_commentaries:
             st.markdown("**Sample Commentaries:**")
-            for commentary in school_commentaries[:3]:
+            for commentary in itertools.islice(school_commentaries, 3):
                 verse = kg.verses.get(commentary.verse_id)
                 if verse:
                     st.markdown(f"• BG {verse.chapter}.{verse.verse} - {commentary.status}")
@@ -575,13 +765,13 @@ def render_node_details_panel(kg, selected_node_id: str = None):
     elif node_type == 'author':
         st.markdown(f"**Author:** {node_key}")
         # Show works by this author
-        author_commentaries = [c for c in kg.commentaries.values()
-                             if c.original_author == node_key or c.substitute_author == node_key]
+        _, by_author = _commentary_indexes(id(kg), kg)
+        author_commentaries = by_author.get(node_key, [])
         st.markdown(f"**Total Works:** {len(author_commentaries)}")
 
         if author_commentaries:
             st.markdown("**Sample Works:**")
-            for commentary in author_commentaries[:3]:
+            for commentary in itertools.islice(author_commentaries, 3):
                 verse = kg.verses.get(commentary.verse_id)
                 if verse:
                     role = "Original" if commentary.original_author == node_key else "Substitute"
@@ -592,31 +782,40 @@ def render_node_details_panel(kg, selected_node_id: str = None):
         st.markdown(f"**ID:** {node_key}")
         st.markdown("*Node details not available*")
 
+def _dataframe_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize a DataFrame to CSV bytes, using Arrow's writer when possible"""
+    if PYARROW_AVAILABLE:
+        try:
+            buf = BytesIO()
+            pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+            return buf.getvalue()
+        except (pa.ArrowException, TypeError, ValueError):
+            # Nested columns (e.g. dict-valued edge attributes) aren't CSV-writable in Arrow
+            pass
+    return df.to_csv(index=False).encode('utf-8')
+
 def export_graph_data(graph: nx.Graph, filename_prefix: str = "gita_graph"):
     """Export graph data in various formats"""
     if not graph.nodes():
         st.warning("No graph data to export")
         return
     
-    # Prepare node data
-    nodes_data = []
-    for node_id, data in graph.nodes(data=True):
-        node_info = {'id': node_id, **data}
-        nodes_data.append(node_info)
-    
-    # Prepare edge data  
-    edges_data = []
-    for source, target, data in graph.edges(data=True):
-        edge_info = {'source': source, 'target': target, **data}
-        edges_data.append(edge_info)
+    # Stream node and edge rows straight into the DataFrames
+    def node_rows():
+        for node_id, data in graph.nodes(data=True):
+            yield {'id': node_id, **data}
+
+    def edge_rows():
+        for source, target, data in graph.edges(data=True):
+            yield {'source': source, 'target': target, **data}
     
     # Create downloadable files
-    nodes_df = pd.DataFrame(nodes_data)
-    edges_df = pd.DataFrame(edges_data)
+    nodes_df = pd.DataFrame.from_records(node_rows(), columns=NODE_EXPORT_COLUMNS)
+    edges_df = pd.DataFrame.from_records(edge_rows(), columns=EDGE_EXPORT_COLUMNS)
     
     # CSV download
-    nodes_csv = nodes_df.to_csv(index=False)
-    edges_csv = edges_df.to_csv(index=False)
+    nodes_csv = _dataframe_to_csv_bytes(nodes_df)
+    edges_csv = _dataframe_to_csv_bytes(edges_df)
     
     col1, col2 = st.columns(2)
     
@@ -636,7 +835,21 @@ def export_graph_data(graph: nx.Graph, filename_prefix: str = "gita_graph"):
             "text/csv"
         )
     
-    # JSON download
+    # JSON download - only serialized once the user asks for it
+    if graph.number_of_nodes() > JSON_EXPORT_NODE_LIMIT:
+        if not st.checkbox(f"Include full JSON export ({graph.number_of_nodes()} nodes)",
+                           key=f"{filename_prefix}_json_large"):
+            return
+
+    json_requested_key = f"{filename_prefix}_json_requested"
+    if st.button("🧾 Prepare Full Graph JSON", key=f"{filename_prefix}_json_prepare"):
+        st.session_state[json_requested_key] = True
+
+    if not st.session_state.get(json_requested_key, False):
+        return
+
+    nodes_data = list(node_rows())
+    edges_data = list(edge_rows())
     graph_json = {
         'nodes': nodes_data,
         'edges': edges_data,
@@ -647,10 +860,13 @@ def export_graph_data(graph: nx.Graph, filename_prefix: str = "gita_graph"):
         }
     }
     
-    json_str = json.dumps(graph_json, indent=2, ensure_ascii=False)
+    if ORJSON_AVAILABLE:
+        json_payload = orjson.dumps(graph_json, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        json_payload = json.dumps(graph_json, indent=2, ensure_ascii=False)
     st.download_button(
         "📥 Download Full Graph JSON",
-        json_str,
+        json_payload,
         f"{filename_prefix}_full.json",
         "application/json"
-    )
\ No newline at end of file
+    )
@@ -3,44 +3,53 @@ import json
 import numpy as np
 import faiss
 from sentence_transformers import SentenceTransformer
+import torch
 from collections import defaultdict, Counter
 import re
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional, Iterator
 import pickle
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime
-import hashlib
 import uuid
 import time
+import sys
+import importlib.util
+import heapq
+import itertools
+import operator
+import sqlite3
+import threading
+import queue
+import gzip
+import base64
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 
-# Import the graph visualization module
 try:
-    from gita_graph_viz import (
-        GitaGraphVisualizer,
-        render_graph_visualization_panel,
-        render_node_details_panel,
-        export_graph_data
-    )
-    GRAPH_VIZ_AVAILABLE = True
+    import orjson
+    ORJSON_AVAILABLE = True
 except ImportError:
-    GRAPH_VIZ_AVAILABLE = False
+    ORJSON_AVAILABLE = False
 
-# Try to import pyvis for graph visualization
 try:
-    from pyvis.network import Network
-    import networkx as nx
-    PYVIS_AVAILABLE = True
-    NETWORKX_AVAILABLE = True
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
 except ImportError:
-    PYVIS_AVAILABLE = False
-    try:
-        import networkx as nx
-        NETWORKX_AVAILABLE = True
-    except ImportError:
-        NETWORKX_AVAILABLE = False
-    # Don't show warning here - will show in UI when needed
+    ONNX_AVAILABLE = False
+
+# Check for pyvis/networkx without importing them; they are imported where first used
+NETWORKX_AVAILABLE = importlib.util.find_spec("networkx") is not None
+PYVIS_AVAILABLE = NETWORKX_AVAILABLE and importlib.util.find_spec("pyvis") is not None
+# gita_graph_viz pulls in networkx, pyvis and pandas at import time, so only probe for it
+GRAPH_VIZ_AVAILABLE = PYVIS_AVAILABLE and importlib.util.find_spec("gita_graph_viz") is not None
+# Don't show warning here - will show in UI when needed
+
+# Let FAISS use every core for (batched) searches
+faiss.omp_set_num_threads(os.cpu_count() or 1)
 
 # Configuration
 EMBEDDING_MODEL = 'sentence-transformers/LaBSE'
@@ -48,12 +57,88 @@ FAISS_INDEX_PATH = "gita_faiss.index"
 MAPPINGS_PATH = "gita_mappings.pkl"
 DATA_FILE = "merged_gita_clean.json"
 SUMMARIES_CACHE = "commentary_summaries.json"
+# Exported (optionally int8-quantized) ONNX model used for CPU-only query encoding
+ONNX_MODEL_DIR = os.environ.get("GITA_ONNX_MODEL_DIR", "onnx_int8")
+# Sentence-transformers model the FAISS index was built with (and the ONNX export must match)
+SENTENCE_MODEL = 'Lajavaness/bilingual-embedding-base'
+# Pooling modes OnnxSentenceEncoder can reproduce from the export's 1_Pooling/config.json
+ONNX_POOLING_MODES = ('mean_tokens', 'cls_token', 'max_tokens')
+
+# Groq prompt pieces shared by every aggregate call
+_GROQ_EXAMPLE = '''Example:
+User question: "What is dharma?"
+EXCERPTS:
+C1 | Sri Vaisnava Sampradaya | "Dharma means righteous duty according to one's station in life..."
+C2 | Advaita Vedanta | "Dharma is the eternal law that upholds cosmic order..."
+
+Expected JSON:
+{
+  "summary": "Dharma represents righteous duty and eternal law that maintains cosmic order according to one's life circumstances.",
+  "direction": "practical_action",
+  "supporting_ids": ["C1", "C2"],
+  "supporting_schools": ["Sri Vaisnava Sampradaya", "Advaita Vedanta"],
+  "confidence_score": 0.8,
+  "note": "Strong consensus across schools on dharma as duty and cosmic law."
+}'''
+
+_GROQ_INSTRUCTION = '''Instruction: You must respond with ONLY valid JSON. No other text. Produce JSON with these exact keys: summary (2-3 sentence synthesis to answer the user question), direction (practical_action|renunciation|devotional|mixed), supporting_ids (array of excerpt IDs used), supporting_schools (array of schools), confidence_score (0.0-1.0), note (short justification). Example format:
+{"summary": "Your synthesis here", "direction": "mixed", "supporting_ids": ["C1"], "supporting_schools": ["School Name"], "confidence_score": 0.8, "note": "Justification"}'''
+
+_GROQ_BATCH_INSTRUCTION = '''Instruction: You must respond with ONLY valid JSON. No other text. Produce a JSON array with one object per VERSE above, each with these exact keys: verse_id (the VERSE label), summary (2-3 sentence synthesis of that verse's excerpts to answer the user question), direction (practical_action|renunciation|devotional|mixed), supporting_ids (array of that verse's excerpt IDs used), supporting_schools (array of schools), confidence_score (0.0-1.0), note (short justification). Example format:
+[{"verse_id": "2.47", "summary": "Your synthesis here", "direction": "mixed", "supporting_ids": ["C1"], "supporting_schools": ["School Name"], "confidence_score": 0.8, "note": "Justification"}]'''
+
+_GROQ_SYSTEM_MSG = 'You are a scholar of Hindu exegesis. Use only provided excerpts. Do not add facts or invent attributions. You must respond with ONLY valid JSON - no explanations, no markdown, no extra text. Just pure JSON.'
+
+# Groq aggregate log, written by a background thread; flushed every N entries or when idle
+GROQ_LOG_FILE = "groq_aggregate_logs.jsonl"
+LOG_FLUSH_EVERY = 20
+LOG_FLUSH_SECONDS = 1.0
+
+# Concurrent Groq calls when summarizing several verses at once (rate limits permitting)
+GROQ_MAX_WORKERS = 4
+# Excerpts per verse when several verses share one batched Groq prompt
+GROQ_BATCH_EXCERPTS_PER_VERSE = 6
+
+
+# Number of distinct schools that counts as full coverage in hybrid confidence
+COVERAGE_SCHOOL_CAP = 4
+
+# Directions a Groq summary may carry, and their display labels
+_ALLOWED_DIRECTIONS = frozenset({"practical_action", "renunciation", "devotional", "jnana", "mixed", "insufficient_evidence"})
+_DIRECTION_LABEL = {d: d.replace('_', ' ').title() for d in _ALLOWED_DIRECTIONS}
+
+# (floor, label, renderer) from highest to lowest, for the confidence display
+_CONFIDENCE_BUCKETS = ((0.7, 'High', st.success), (0.4, 'Medium', st.warning), (0.0, 'Low', st.error))
 
 # Free Trial Configuration
 FREE_TRIAL_USES = 3
-USAGE_TRACKING_FILE = "usage_tracking.json"
-
-@dataclass
+USAGE_DB_FILE = "usage_tracking.db"
+LEGACY_USAGE_TRACKING_FILE = "usage_tracking.json"
+
+# Provenance path text per hit kind, formatted with (node_key, verse_id)
+PROVENANCE_TEMPLATES = {
+    'verse': "Query → Verse({1})",
+    'commentary': "Query → Commentary({0}) → Verse({1})",
+    'concept': "Query → Concept({0}) → Verse({1})"
+}
+
+# Sentence spans for excerpt splitting (runs of text between . ! ?)
+_SENTENCE_RE = re.compile(r'[^.!?]+')
+
+# Outermost {...} block in a model reply that may carry extra text
+_JSON_EXTRACT_RE = re.compile(r'\{.*\}', re.DOTALL)
+# Outermost [...] block, for batched replies
+_JSON_ARRAY_EXTRACT_RE = re.compile(r'\[.*\]', re.DOTALL)
+
+# Integer codes for FAISS node types, precomputed per index row in load_mappings
+NODE_TYPE_VERSE, NODE_TYPE_COMMENTARY, NODE_TYPE_CONCEPT, NODE_TYPE_UNKNOWN = 0, 1, 2, 255
+NODE_TYPE_CODES = {
+    'verse': NODE_TYPE_VERSE,
+    'commentary': NODE_TYPE_COMMENTARY,
+    'concept': NODE_TYPE_CONCEPT
+}
+
+@dataclass(slots=True)
 class VerseNode:
     id: str
     chapter: int
@@ -63,13 +148,15 @@ class VerseNode:
     translations: Dict[str, str]
     word_meaning: Dict[str, str]
 
-@dataclass
+@dataclass(slots=True)
 class ConceptNode:
     term: str
     meaning: str
     mentioned_in: List[str]
+    mentioned_rows: Optional[np.ndarray] = None  # unique verse rows in mentioned_in
+    mentioned_counts: Optional[np.ndarray] = None  # times each of mentioned_rows appears in mentioned_in
 
-@dataclass
+@dataclass(slots=True)
 class CommentaryNode:
     id: str
     school: str
@@ -78,8 +165,13 @@ class CommentaryNode:
     substitute_author: str
     text: str
     verse_id: str
+    stripped_len: int = field(init=False)
 
-@dataclass
+    def __post_init__(self):
+        # Length of the text without surrounding whitespace, computed once at load
+        self.stripped_len = len(self.text.strip()) if self.text else 0
+
+@dataclass(slots=True)
 class SearchResult:
     verse: VerseNode
     score: float
@@ -95,43 +187,58 @@ def get_user_id():
         st.session_state.user_id = str(uuid.uuid4())
     return st.session_state.user_id
 
-def load_usage_data():
-    """Load usage tracking data from file"""
-    try:
-        if os.path.exists(USAGE_TRACKING_FILE):
-            with open(USAGE_TRACKING_FILE, 'r') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
+def _usage_db():
+    """Open a connection to the usage tracking database"""
+    return sqlite3.connect(USAGE_DB_FILE, timeout=10)
 
-def save_usage_data(usage_data):
-    """Save usage tracking data to file"""
+@st.cache_resource
+def init_usage_db():
+    """Create the usage table (WAL mode) and import any legacy JSON tracking data, once per process"""
     try:
-        with open(USAGE_TRACKING_FILE, 'w') as f:
-            json.dump(usage_data, f, indent=2)
+        with closing(_usage_db()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage("
+                "user_id TEXT PRIMARY KEY, count INTEGER NOT NULL, first_use TEXT, last_use TEXT)"
+            )
+            if os.path.exists(LEGACY_USAGE_TRACKING_FILE):
+                with open(LEGACY_USAGE_TRACKING_FILE, 'r') as f:
+                    legacy_data = json.load(f)
+                conn.executemany(
+                    "INSERT OR IGNORE INTO usage(user_id, count, first_use, last_use) VALUES (?, ?, ?, ?)",
+                    [
+                        (user_id, info.get('usage_count', 0), info.get('first_use'), info.get('last_use'))
+                        for user_id, info in legacy_data.items()
+                    ]
+                )
+            conn.commit()
     except Exception:
         pass
 
 def get_user_usage_count(user_id):
     """Get the current usage count for a user"""
-    usage_data = load_usage_data()
-    return usage_data.get(user_id, {}).get('usage_count', 0)
-
-def increment_user_usage(user_id):
-    """Increment usage count for a user"""
-    usage_data = load_usage_data()
-    if user_id not in usage_data:
-        usage_data[user_id] = {
-            'usage_count': 0,
-            'first_use': datetime.now().isoformat(),
-            'last_use': datetime.now().isoformat()
-        }
-
-    usage_data[user_id]['usage_count'] += 1
-    usage_data[user_id]['last_use'] = datetime.now().isoformat()
-    save_usage_data(usage_data)
-    return usage_data[user_id]['usage_count']
+    try:
+        with closing(_usage_db()) as conn:
+            row = conn.execute("SELECT count FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+    except sqlite3.Error:
+        return 0
+    return row[0] if row else 0
+
+def increment_user_usage(user_id, uses: int = 1):
+    """Increment usage count for a user by uses"""
+    now = datetime.now().isoformat()
+    try:
+        with closing(_usage_db()) as conn, conn:
+            conn.execute(
+                "INSERT INTO usage(user_id, count, first_use, last_use) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET count = count + excluded.count, last_use = excluded.last_use",
+                (user_id, uses, now, now)
+            )
+            row = conn.execute("SELECT count FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+    except sqlite3.Error:
+        return 0
+    get_remaining_free_uses.clear()
+    return row[0]
 
 def get_free_trial_api_key():
     """Get the free trial API key from secrets"""
@@ -140,36 +247,40 @@ def get_free_trial_api_key():
     except Exception:
         return ""
 
+def free_trial_uses_left(user_id):
+    """Free-trial uses still available, holding back one per queued free-trial summary in flight"""
+    in_flight = sum(1 for _, free_trial in st.session_state.get('pending_summaries', {}).values() if free_trial)
+    return max(0, FREE_TRIAL_USES - get_user_usage_count(user_id) - in_flight)
+
 def can_use_free_trial(user_id):
     """Check if user can still use free trial"""
-    usage_count = get_user_usage_count(user_id)
-    return usage_count < FREE_TRIAL_USES
+    return free_trial_uses_left(user_id) > 0
 
+@st.cache_data(ttl=60, show_spinner=False)
 def get_remaining_free_uses(user_id):
-    """Get remaining free uses for a user"""
+    """Get remaining free uses for a user (cached; cleared whenever usage is incremented)"""
     usage_count = get_user_usage_count(user_id)
     return max(0, FREE_TRIAL_USES - usage_count)
 
-def query_groq_with_usage_tracking(commentaries_data: List[Dict], query: str, api_key: str, is_free_trial: bool = False) -> Dict:
+def _is_grounded_summary(summary: Dict) -> bool:
+    """True when a Groq call came back with a usable summary (free-trial uses count only these)"""
+    return isinstance(summary, dict) and summary.get('summary', "INSUFFICIENT_GROUNDED_EVIDENCE") != "INSUFFICIENT_GROUNDED_EVIDENCE"
+
+def query_groq_with_usage_tracking(commentaries_data: List[Dict], query: str, api_key: str, is_free_trial: bool = False,
+                                   total_schools: Optional[int] = None) -> Dict:
     """Wrapper for GROQ API that handles usage tracking for free trial"""
     if is_free_trial:
         user_id = get_user_id()
         if not can_use_free_trial(user_id):
-            return {
-                "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-                "direction": "insufficient_evidence",
-                "supporting_ids": [],
-                "supporting_schools": [],
-                "confidence_score": 0.0,
-                "note": "Free trial uses exhausted. Please add your own API key."
-            }
-
-        # Increment usage count for free trial
-        new_count = increment_user_usage(user_id)
-        remaining = FREE_TRIAL_USES - new_count
+            return _insufficient_result("Free trial uses exhausted. Please add your own API key.")
 
         # Call the actual API
-        result = query_groq_api_aggregate(commentaries_data, query, api_key)
+        result = query_groq_api_aggregate(commentaries_data, query, api_key, total_schools=total_schools)
+
+        # Only a successful summary uses up a free-trial use
+        if _is_grounded_summary(result):
+            increment_user_usage(user_id)
+        remaining = free_trial_uses_left(user_id)
 
         # Add usage info to the result
         if isinstance(result, dict):
@@ -181,14 +292,47 @@ def query_groq_with_usage_tracking(commentaries_data: List[Dict], query: str, ap
         return result
     else:
         # Regular API call without usage tracking
-        return query_groq_api_aggregate(commentaries_data, query, api_key)
+        return query_groq_api_aggregate(commentaries_data, query, api_key, total_schools=total_schools)
+
+init_usage_db()
 
 # Cached resource loaders
+_faiss_gpu_resources = None
+
+def _configure_index_search(index):
+    """Apply search-time parameters for IVF/HNSW indexes (no-op for flat indexes)"""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = int(os.environ.get("GITA_NPROBE", 16))
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(os.environ.get("GITA_EF_SEARCH", 64))
+    return index
+
+def _search_params(index, search_knob: Optional[int]):
+    """Per-call FAISS search parameters (nprobe for IVF, efSearch for HNSW); None keeps the index defaults"""
+    if search_knob is None:
+        return None
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=int(search_knob))
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(search_knob))
+    return None
+
+def _maybe_move_index_to_gpu(index):
+    """Move the index to GPU 0 when opted in via GITA_USE_GPU_FAISS and a GPU is present"""
+    global _faiss_gpu_resources
+    if os.environ.get("GITA_USE_GPU_FAISS", "0") != "1":
+        return index
+    if not hasattr(faiss, "StandardGpuResources") or faiss.get_num_gpus() == 0:
+        return index
+    if _faiss_gpu_resources is None:
+        _faiss_gpu_resources = faiss.StandardGpuResources()
+    return faiss.index_cpu_to_gpu(_faiss_gpu_resources, 0, index)
+
 @st.cache_resource
 def load_faiss_index(path: str):
     """Load FAISS index with caching"""
     try:
-        return faiss.read_index(path)
+        return _maybe_move_index_to_gpu(_configure_index_search(faiss.read_index(path)))
     except Exception as e:
         st.error(f"Failed to load FAISS index: {e}")
         return None
@@ -198,33 +342,114 @@ def load_mappings(path: str):
     """Load mappings with caching"""
     try:
         with open(path, "rb") as f:
-            return pickle.load(f)
+            mappings = pickle.load(f)
     except Exception as e:
         st.error(f"Failed to load mappings: {e}")
         return None
+    _index_node_ids(mappings)
+    return mappings
+
+def _index_node_ids(mappings: Dict):
+    """Split every FAISS node id once into integer type codes and key strings"""
+    id_to_node = mappings['id_to_node']
+    entries = id_to_node.items() if isinstance(id_to_node, dict) else enumerate(id_to_node)
+    entries = list(entries)
+    size = max((idx for idx, _ in entries), default=-1) + 1
+    node_types = np.full(size, NODE_TYPE_UNKNOWN, dtype=np.uint8)
+    node_keys = [''] * size
+    for idx, node_id in entries:
+        node_type, _, node_key = node_id.partition(':')
+        node_types[idx] = NODE_TYPE_CODES.get(node_type, NODE_TYPE_UNKNOWN)
+        node_keys[idx] = node_key
+    mappings['node_types'] = node_types
+    mappings['node_keys'] = node_keys
+
+def _prepare_embedding_model(model, device: str):
+    """Put the model in inference mode, using FP16 weights on GPU"""
+    if device == "cuda":
+        model.half()
+    model.eval()
+    return model
+
+class OnnxSentenceEncoder:
+    """Minimal SentenceTransformer-style encode() over an ONNX Runtime export"""
+
+    def __init__(self, model_dir: str):
+        # Read pooling first so an export we can't reproduce is refused before loading weights
+        self.pooling_mode = self._read_pooling_mode(model_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, provider='CPUExecutionProvider')
+
+    @staticmethod
+    def _read_pooling_mode(model_dir: str) -> str:
+        """Pooling mode from the sentence-transformers pooling config exported with the model"""
+        path = os.path.join(model_dir, '1_Pooling', 'config.json')
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        modes = [key[len('pooling_mode_'):] for key, enabled in config.items()
+                 if key.startswith('pooling_mode_') and enabled]
+        if len(modes) != 1 or modes[0] not in ONNX_POOLING_MODES:
+            raise ValueError(f"unsupported pooling {modes or 'none'} in {path}")
+        return modes[0]
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.config.hidden_size
+
+    def encode(self, sentences, batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            features = self.tokenizer(sentences[start:start + batch_size], padding=True,
+                                      truncation=True, return_tensors='np')
+            hidden = self.model(**features).last_hidden_state
+            hidden = hidden.numpy() if hasattr(hidden, 'numpy') else np.asarray(hidden)
+            # Pool the way the sentence-transformers model does, over real tokens only
+            mask = features['attention_mask'][..., None].astype(np.float32)
+            if self.pooling_mode == 'cls_token':
+                pooled = hidden[:, 0]
+            elif self.pooling_mode == 'max_tokens':
+                pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+            else:
+                pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled.astype(np.float32))
+        embeddings = np.vstack(batches)
+        if normalize_embeddings:
+            faiss.normalize_L2(embeddings)
+        return embeddings
 
 @st.cache_resource
 def load_embedding_model(name: str = EMBEDDING_MODEL):
     """Load embedding model with caching"""
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if device == "cpu":
+        torch.set_num_threads(os.cpu_count() or 1)
+        if ONNX_AVAILABLE and os.path.isdir(ONNX_MODEL_DIR):
+            try:
+                return OnnxSentenceEncoder(ONNX_MODEL_DIR)
+            except Exception as e:
+                st.warning(f"Failed to load ONNX embedding model, using PyTorch: {e}")
+
     try:
-        model = SentenceTransformer('Lajavaness/bilingual-embedding-base', trust_remote_code=True)
-        return model
+        model = SentenceTransformer(SENTENCE_MODEL, trust_remote_code=True, device=device)
+        return _prepare_embedding_model(model, device)
     except Exception as e:
         st.error(f"Failed to load primary embedding model: {e}")
         try:
-            model = SentenceTransformer('all-MiniLM-L6-v2')
+            model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
             st.warning("Using fallback embedding model")
-            return model
+            return _prepare_embedding_model(model, device)
         except Exception as e2:
             st.error(f"Failed to load fallback embedding model: {e2}")
             return None
 
-@st.cache_data
+@st.cache_resource
 def load_knowledge_graph_data(data_file: str):
-    """Load and process knowledge graph data with caching"""
+    """Load and process knowledge graph data once per process (shared read-only by all sessions)"""
     try:
-        with open(data_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(data_file, 'rb') as f:
+            data = orjson.loads(f.read()) if ORJSON_AVAILABLE else json.load(f)
     except FileNotFoundError:
         st.error(f"Data file {data_file} not found.")
         return None
@@ -232,6 +457,7 @@ def load_knowledge_graph_data(data_file: str):
     verses = {}
     concepts = {}
     commentaries = {}
+    commentaries_by_verse = defaultdict(list)
     schools = set()
     authors = set()
     
@@ -257,7 +483,7 @@ def load_knowledge_graph_data(data_file: str):
             if not verse_num:
                 continue
 
-            verse_id = f"{chapter_num}:{verse_num}"
+            verse_id = sys.intern(f"{chapter_num}:{verse_num}")
 
             # Store only essential verse data
             verse = VerseNode(
@@ -316,10 +542,29 @@ def load_knowledge_graph_data(data_file: str):
                 )
                 commentaries[commentary_id] = commentary
 
+    # Index after the loop: a verse repeated in the data replaces its commentaries by id,
+    # so appending inside the loop would keep superseded and repeated entries
+    for commentary in commentaries.values():
+        commentaries_by_verse[commentary.verse_id].append(commentary)
+
+    # Stable row index per verse for array-backed scoring
+    verse_ids = list(verses)
+    verse_row = {verse_id: row for row, verse_id in enumerate(verse_ids)}
+    for concept in concepts.values():
+        # A verse repeated in the data is mentioned more than once; keep that multiplicity as counts
+        rows, counts = np.unique(np.asarray([verse_row[v] for v in concept.mentioned_in], dtype=np.int32),
+                                 return_counts=True)
+        concept.mentioned_rows = rows.astype(np.int32)
+        concept.mentioned_counts = counts.astype(np.int32)
+
     return {
         'verses': verses,
+        'verse_ids': verse_ids,
+        'verse_row': verse_row,
         'concepts': concepts,
         'commentaries': commentaries,
+        'commentaries_by_verse': dict(commentaries_by_verse),
+        'by_type': {'verse': verses, 'commentary': commentaries, 'concept': concepts},
         'schools': schools,
         'authors': authors,
         'verse_metadata': verse_metadata,
@@ -327,96 +572,175 @@ def load_knowledge_graph_data(data_file: str):
         'concept_metadata': concept_metadata
     }
 
-@st.cache_resource  # Cache search results as in-memory resources to avoid pickling issues
-def perform_search(query: str, top_k: int, _index, _mappings, _kg_data):
-    """Perform cached search with TTL"""
-    if not _index or not _mappings or not _kg_data:
-        return []
-
-    # Load model for encoding query
-    model = load_embedding_model()
-    if not model:
-        return []
-
-    # Encode query
-    query_embedding = model.encode([query], normalize_embeddings=True)
-    
-    # Search FAISS index
-    scores, indices = _index.search(query_embedding.astype('float32'), top_k * 3)
+def _model_cache_id(model) -> str:
+    """Identify an embedding model instance in cache keys (models themselves are not hashed)"""
+    return f"{type(model).__module__}.{type(model).__qualname__}:{id(model)}"
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def _encode_query(text: str, model_id: str, _model) -> bytes:
+    """Encode a query once per model and keep its float32 embedding bytes for repeat searches"""
+    with torch.inference_mode():
+        embedding = _model.encode([text], normalize_embeddings=False, convert_to_numpy=True)
+    # Normalize in place on the float32 buffer FAISS will search with
+    embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+    faiss.normalize_L2(embedding)
+    return embedding.tobytes()
+
+def encode_many(model, texts: List[str], batch_size: int = 32, normalize: bool = True) -> np.ndarray:
+    """Encode texts in length-sorted batches so each batch pads to similar lengths"""
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    if isinstance(model, SentenceTransformer):
+        # SentenceTransformer.encode already length-sorts its batches internally
+        with torch.inference_mode():
+            return model.encode(texts, batch_size=batch_size,
+                                normalize_embeddings=normalize, convert_to_numpy=True)
+    # The ONNX encoder batches in input order; character length is a cheap proxy for token count
+    order = np.argsort([len(text) for text in texts], kind='stable')
+    with torch.inference_mode():
+        embeddings = model.encode([texts[i] for i in order], batch_size=batch_size,
+                                  normalize_embeddings=normalize, convert_to_numpy=True)
+    # Undo the length sort so rows line up with the input order
+    return embeddings[np.argsort(order)]
+
+def _rank_candidates(scores_row, indices_row, top_k: int, mappings, kg_data) -> List[SearchResult]:
+    """Turn one row of FAISS hits into ranked verse-level search results"""
+    node_types = mappings['node_types']
+    node_keys = mappings['node_keys']
+    verses = kg_data['verses']
+    concepts = kg_data['concepts']
+    commentaries = kg_data['commentaries']
+    commentaries_by_verse = kg_data['commentaries_by_verse']
+    verse_ids = kg_data['verse_ids']
+    verse_row = kg_data['verse_row']
     
-    # Process results
-    candidate_verses = defaultdict(lambda: {
-        'scores': [],
-        'provenance_paths': [],
-        'concepts': set(),
-        'support_count': 0
-    })
+    # Per-verse accumulators laid out by verse row (structure of arrays)
+    num_verses = len(verse_ids)
+    score_sum = np.zeros(num_verses, dtype=np.float32)
+    score_count = np.zeros(num_verses, dtype=np.int32)
+    concept_count = np.zeros(num_verses, dtype=np.int32)
+    support_count = np.zeros(num_verses, dtype=np.int32)
+    provenance_paths = defaultdict(set)
+    concept_hits = {}
     
-    id_to_node = _mappings['id_to_node']
-    verses = _kg_data['verses']
-    concepts = _kg_data['concepts']
-    commentaries = _kg_data['commentaries']
-    
-    for score, idx in zip(scores[0], indices[0]):
+    for score, idx in zip(scores_row, indices_row):
         if idx == -1:
             continue
             
-        node_id = id_to_node[idx]
-        node_type, node_key = node_id.split(':', 1)
+        node_type = node_types[idx]
+        node_key = node_keys[idx]
         
-        if node_type == 'verse':
-            candidate_verses[node_key]['scores'].append(score)
-            candidate_verses[node_key]['provenance_paths'].append(f"Query → Verse({node_key})")
-            candidate_verses[node_key]['support_count'] += 1
+        if node_type == NODE_TYPE_VERSE:
+            row = verse_row.get(node_key)
+            if row is not None:
+                score_sum[row] += score
+                score_count[row] += 1
+                support_count[row] += 1
+                provenance_paths[row].add(('verse', node_key, node_key))
             
-        elif node_type == 'commentary':
+        elif node_type == NODE_TYPE_COMMENTARY:
             commentary = commentaries.get(node_key)
             if commentary:
                 verse_id = commentary.verse_id
-                candidate_verses[verse_id]['scores'].append(score * 0.9)
-                candidate_verses[verse_id]['provenance_paths'].append(
-                    f"Query → Commentary({commentary.school}) → Verse({verse_id})"
-                )
-                candidate_verses[verse_id]['support_count'] += 1
+                row = verse_row.get(verse_id)
+                if row is not None:
+                    score_sum[row] += score * 0.9
+                    score_count[row] += 1
+                    support_count[row] += 1
+                    provenance_paths[row].add(('commentary', commentary.school, verse_id))
                 
-        elif node_type == 'concept':
+        elif node_type == NODE_TYPE_CONCEPT:
             concept = concepts.get(node_key)
-            if concept:
-                for verse_id in concept.mentioned_in:
-                    candidate_verses[verse_id]['scores'].append(score * 0.8)
-                    candidate_verses[verse_id]['provenance_paths'].append(
-                        f"Query → Concept({node_key}) → Verse({verse_id})"
-                    )
-                    candidate_verses[verse_id]['concepts'].add(node_key)
-                    candidate_verses[verse_id]['support_count'] += 1
+            if concept is not None and concept.mentioned_rows is not None and concept.mentioned_rows.size:
+                # mentioned_rows is unique, so fancy-indexed adds are exact; counts weight
+                # each verse by how often the concept mentions it
+                rows = concept.mentioned_rows
+                counts = concept.mentioned_counts
+                score_sum[rows] += (score * 0.8) * counts
+                score_count[rows] += counts
+                support_count[rows] += counts
+                # concept_count counts distinct concepts per verse
+                if node_key not in concept_hits:
+                    concept_count[rows] += 1
+                    concept_hits[node_key] = rows
+
+    # Score every touched verse in one vectorized pass
+    touched = np.flatnonzero(support_count)
+    if touched.size == 0:
+        return []
+    final = (
+        score_sum[touched] / np.maximum(score_count[touched], 1)
+        + 0.1 * concept_count[touched]
+        + np.minimum(0.05 * support_count[touched], 0.2)
+    )
+    
+    # Select the top_k rows without fully sorting every candidate
+    if touched.size > top_k:
+        top = np.argpartition(-final, top_k)[:top_k]
+    else:
+        top = np.arange(touched.size)
+    top = top[np.argsort(-final[top], kind='stable')]
+
+    # Resolve concept provenance only for the selected verses
+    verse_concepts = defaultdict(list)
+    selected_rows = touched[top]
+    for node_key, rows in concept_hits.items():
+        for row in np.intersect1d(rows, selected_rows, assume_unique=True).tolist():
+            verse_concepts[row].append(node_key)
+            provenance_paths[row].add(('concept', node_key, verse_ids[row]))
 
     # Create results
     results = []
-    for verse_id, data in candidate_verses.items():
-        verse = verses.get(verse_id)
-        if not verse:
-            continue
-            
-        avg_score = np.mean(data['scores']) if data['scores'] else 0
-        concept_boost = len(data['concepts']) * 0.1
-        support_boost = min(data['support_count'] * 0.05, 0.2)
-        final_score = avg_score + concept_boost + support_boost
-        
-        # Get related commentaries
-        verse_commentaries = [c for c in commentaries.values() if c.verse_id == verse_id]
-        
+    for pos in top:
+        row = int(touched[pos])
+        verse_id = verse_ids[row]
         result = SearchResult(
-            verse=verse,
-            score=final_score,
-            provenance_path=list(set(data['provenance_paths'])),
-            related_concepts=list(data['concepts']),
-            commentaries=verse_commentaries,
-            support_count=data['support_count']
+            verse=verses[verse_id],
+            score=float(final[pos]),
+            provenance_path=[
+                PROVENANCE_TEMPLATES[kind].format(node_key, target)
+                for kind, node_key, target in provenance_paths[row]
+            ],
+            related_concepts=verse_concepts[row],
+            commentaries=commentaries_by_verse.get(verse_id, []),
+            support_count=int(support_count[row])
         )
         results.append(result)
     
-    results.sort(key=lambda x: x.score, reverse=True)
-    return results[:top_k]
+    return results
+
+def perform_search_batch(queries: List[str], top_k: int, _index, _mappings, _kg_data,
+                         search_knob: Optional[int] = None) -> List[List[SearchResult]]:
+    """Search several queries with one batched encode and one FAISS call"""
+    if not queries or not _index or not _mappings or not _kg_data:
+        return [[] for _ in queries]
+
+    # Load model for encoding queries
+    model = load_embedding_model()
+    if not model:
+        return [[] for _ in queries]
+
+    # Encode queries (repeat queries hit the embedding cache) into one (N, d) matrix
+    query_embeddings = np.vstack([
+        np.frombuffer(_encode_query(query, _model_cache_id(model), model), dtype=np.float32) for query in queries
+    ])
+    
+    # Search FAISS index once for the whole batch; the shared index itself is never mutated
+    params = _search_params(_index, search_knob)
+    if params is None:
+        scores, indices = _index.search(query_embeddings, top_k * 3)
+    else:
+        scores, indices = _index.search(query_embeddings, top_k * 3, params=params)
+    
+    return [
+        _rank_candidates(scores_row, indices_row, top_k, _mappings, _kg_data)
+        for scores_row, indices_row in zip(scores, indices)
+    ]
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def perform_search(query: str, top_k: int, _index, _mappings, _kg_data, search_knob: Optional[int] = None):
+    """Perform cached search, keyed on (query, top_k, search_knob); index and data are not hashed"""
+    return perform_search_batch([query], top_k, _index, _mappings, _kg_data, search_knob)[0]
 
 def get_index_health_info():
     """Get health information about the current index"""
@@ -457,6 +781,30 @@ def auto_load_index():
                     return True
     return st.session_state.get('index_ready', False)
 
+def _warmup():
+    """Fill the resource caches and run one encode so the first query starts warm"""
+    try:
+        if os.path.exists(FAISS_INDEX_PATH) and os.path.exists(MAPPINGS_PATH):
+            load_faiss_index(FAISS_INDEX_PATH)
+            load_mappings(MAPPINGS_PATH)
+        if os.path.exists(DATA_FILE):
+            load_knowledge_graph_data(DATA_FILE)
+        model = load_embedding_model()
+        if model is not None:
+            encode_many(model, ["warm up"])
+    except Exception:
+        # Warm-up is best effort; the regular load path reports real failures
+        pass
+
+@st.cache_resource
+def _start_warmup():
+    """Start the warm-up thread once per server process, not once per rerun"""
+    thread = threading.Thread(target=_warmup, name="gita-warmup", daemon=True)
+    thread.start()
+    return thread
+
+_start_warmup()
+
 def render_health_card():
     """Render system health card in sidebar"""
     st.sidebar.subheader("📊 System Status")
@@ -467,6 +815,15 @@ def render_health_card():
             kg_data = st.session_state.kg_data
             st.sidebar.write(f"📚 {len(kg_data['verses'])} verses")
             st.sidebar.write(f"🏫 {len(kg_data['schools'])} schools")
+
+        # Search-time tuning for approximate indexes; kept per session and passed into each
+        # search, since the cached index is shared by every session
+        index = st.session_state.get('index')
+        if isinstance(index, faiss.IndexIVF):
+            st.sidebar.slider("FAISS nprobe", 1, max(index.nlist, 1),
+                              min(index.nprobe, max(index.nlist, 1)), key="faiss_search_knob")
+        elif isinstance(index, faiss.IndexHNSW):
+            st.sidebar.slider("FAISS efSearch", 16, 512, index.hnsw.efSearch, key="faiss_search_knob")
     else:
         st.sidebar.info("🔄 Will load on first search")
 
@@ -500,7 +857,7 @@ def render_custom_graph_visualization(subgraph: Dict, results: List[SearchResult
     with st.expander("📋 Node Type Breakdown", expanded=True):
         node_types = {}
         for node in subgraph['nodes']:
-            node_type = node.split(':')[0]
+            node_type = node.partition(':')[0]
             node_types[node_type] = node_types.get(node_type, 0) + 1
 
         # Create columns for node types
@@ -524,7 +881,7 @@ def render_custom_graph_visualization(subgraph: Dict, results: List[SearchResult
 
         if selected_node != "Select a node...":
             st.session_state.selected_graph_node = selected_node
-            render_node_details(selected_node, subgraph, results)
+            render_node_details(selected_node, subgraph, results, st.session_state.get('kg_data'))
 
     # Network structure visualization
     with st.expander("🕸️ Network Structure", expanded=st.session_state.show_network_structure):
@@ -604,12 +961,14 @@ Node Types:
             key="download_summary"
         )
 
-def render_node_details(node_id: str, subgraph: Dict, results: List[SearchResult]):
+def render_node_details(node_id: str, subgraph: Dict, results: List[SearchResult], kg_data: Dict = None):
     """Render details for a selected node"""
 
     st.markdown(f"### 📋 Node Details: `{node_id}`")
 
-    node_type, node_key = node_id.split(':', 1)
+    node_type, _, node_key = node_id.partition(':')
+    # Direct lookup of the underlying verse/concept/commentary object
+    node_obj = kg_data['by_type'].get(node_type, {}).get(node_key) if kg_data else None
 
     # Get node data
     node_data = subgraph.get('node_data', {}).get(node_id, {})
@@ -625,22 +984,17 @@ def render_node_details(node_id: str, subgraph: Dict, results: List[SearchResult
                 st.markdown("**Sanskrit Text:**")
                 st.code(node_data['shloka'])
 
-        # Find related results
-        for result in results:
-            if result.verse.id == node_key:
-                st.markdown("**English Translation:**")
-                st.write(result.verse.translation)
-                break
+        translation = node_obj.translations.get('english', '') if node_obj else ''
+        if translation:
+            st.markdown("**English Translation:**")
+            st.write(translation)
 
     elif node_type == 'concept':
         st.markdown("**Type:** Concept")
         st.write(f"**Term:** {node_key}")
 
         # Show which verses mention this concept
-        related_verses = []
-        for result in results:
-            if node_key in result.related_concepts:
-                related_verses.append(result.verse.id)
+        related_verses = node_obj.mentioned_in if node_obj else []
 
         if related_verses:
             st.markdown("**Mentioned in verses:**")
@@ -678,7 +1032,7 @@ def render_network_structure(subgraph: Dict):
     # Group nodes by type
     nodes_by_type = {}
     for node in subgraph['nodes']:
-        node_type = node.split(':', 1)[0]
+        node_type = node.partition(':')[0]
         if node_type not in nodes_by_type:
             nodes_by_type[node_type] = []
         nodes_by_type[node_type].append(node)
@@ -698,13 +1052,13 @@ def render_network_structure(subgraph: Dict):
                 node_cols = st.columns(min(len(nodes), 3))
                 for i, node in enumerate(nodes):
                     with node_cols[i % 3]:
-                        st.code(node.split(':', 1)[1][:20] + "..." if len(node.split(':', 1)[1]) > 20 else node.split(':', 1)[1])
+                        st.code(_truncate(node.partition(':')[2], 20))
             else:
                 # Show first 6 and count the rest
                 node_cols = st.columns(3)
                 for i, node in enumerate(nodes[:6]):
                     with node_cols[i % 3]:
-                        st.code(node.split(':', 1)[1][:20] + "..." if len(node.split(':', 1)[1]) > 20 else node.split(':', 1)[1])
+                        st.code(_truncate(node.partition(':')[2], 20))
                 st.write(f"... and {len(nodes) - 6} more {node_type} nodes")
 
             st.markdown("---")
@@ -724,8 +1078,8 @@ def render_network_structure(subgraph: Dict):
         # Show some example connections
         st.markdown("**Example Connections:**")
         for i, edge in enumerate(subgraph['edges'][:5]):
-            source_short = edge['source'].split(':', 1)[1][:15] + "..." if len(edge['source'].split(':', 1)[1]) > 15 else edge['source'].split(':', 1)[1]
-            target_short = edge['target'].split(':', 1)[1][:15] + "..." if len(edge['target'].split(':', 1)[1]) > 15 else edge['target'].split(':', 1)[1]
+            source_short = _truncate(edge['source'].partition(':')[2], 15)
+            target_short = _truncate(edge['target'].partition(':')[2], 15)
             st.write(f"• {source_short} → {target_short}")
 
         if len(subgraph['edges']) > 5:
@@ -758,7 +1112,7 @@ def render_simple_graph_visualization(subgraph: Dict):
     # Create a simple ASCII-style graph representation
     nodes_by_type = {}
     for node in subgraph['nodes']:
-        node_type = node.split(':', 1)[0]
+        node_type = node.partition(':')[0]
         if node_type not in nodes_by_type:
             nodes_by_type[node_type] = []
         nodes_by_type[node_type].append(node)
@@ -772,17 +1126,17 @@ def render_simple_graph_visualization(subgraph: Dict):
     if 'verse' in nodes_by_type:
         graph_text += "📜 VERSES:\n"
         for verse in nodes_by_type['verse'][:3]:  # Show first 3
-            verse_id = verse.split(':', 1)[1]
+            verse_id = verse.partition(':')[2]
             graph_text += f"   [{verse_id}]\n"
 
             # Show connections to this verse
             connections = []
             for edge in subgraph['edges']:
                 if edge['target'] == verse:
-                    source_id = edge['source'].split(':', 1)[1][:15]
+                    source_id = edge['source'].partition(':')[2][:15]
                     connections.append(f"{source_id} --{edge['relationship']}--> ")
                 elif edge['source'] == verse:
-                    target_id = edge['target'].split(':', 1)[1][:15]
+                    target_id = edge['target'].partition(':')[2][:15]
                     connections.append(f" --{edge['relationship']}--> {target_id}")
 
             for conn in connections[:2]:  # Show first 2 connections
@@ -798,7 +1152,7 @@ def render_simple_graph_visualization(subgraph: Dict):
     # Show concepts
     if 'concept' in nodes_by_type:
         graph_text += "💡 CONCEPTS:\n"
-        concepts = [c.split(':', 1)[1] for c in nodes_by_type['concept'][:5]]
+        concepts = [c.partition(':')[2] for c in nodes_by_type['concept'][:5]]
         graph_text += f"   {' <-> '.join(concepts)}\n\n"
 
         if len(nodes_by_type['concept']) > 5:
@@ -808,7 +1162,7 @@ def render_simple_graph_visualization(subgraph: Dict):
     if 'commentary' in nodes_by_type:
         graph_text += "📝 COMMENTARIES:\n"
         for commentary in nodes_by_type['commentary'][:3]:
-            comm_id = commentary.split(':', 1)[1]
+            comm_id = commentary.partition(':')[2]
             graph_text += f"   ({comm_id})\n"
 
         if len(nodes_by_type['commentary']) > 3:
@@ -826,8 +1180,8 @@ def render_simple_graph_visualization(subgraph: Dict):
     # Show some interesting connection patterns
     connection_patterns = {}
     for edge in subgraph['edges']:
-        source_type = edge['source'].split(':', 1)[0]
-        target_type = edge['target'].split(':', 1)[0]
+        source_type = edge['source'].partition(':')[0]
+        target_type = edge['target'].partition(':')[0]
         relationship = edge['relationship']
 
         pattern = f"{source_type} --{relationship}--> {target_type}"
@@ -842,47 +1196,62 @@ def render_simple_graph_visualization(subgraph: Dict):
     if subgraph['edges']:
         st.markdown("**Sample Connection Path:**")
         sample_edge = subgraph['edges'][0]
-        source_short = sample_edge['source'].split(':', 1)[1][:20]
-        target_short = sample_edge['target'].split(':', 1)[1][:20]
+        source_short = sample_edge['source'].partition(':')[2][:20]
+        target_short = sample_edge['target'].partition(':')[2][:20]
         st.code(f"{source_short} --{sample_edge['relationship']}--> {target_short}")
 
         if len(subgraph['edges']) > 1:
             st.write(f"... and {len(subgraph['edges']) - 1} more connection paths")
 
-def render_pyvis_graph_visualization(subgraph: Dict, results: List[SearchResult], query: str):
-    """Render an interactive graph visualization using pyvis"""
+VISJS_TEMPLATE_NODE_LIMIT = 60
+
+# Bare vis-network page for small graphs; placeholders are replaced with JSON
+_VISJS_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="https://unpkg.com/vis-network/standalone/umd/vis-network.min.js"></script>
+<style>
+  body { margin: 0; background: #222222; }
+  #mynetwork { width: 100%; height: 600px; }
+</style>
+</head>
+<body>
+<div id="mynetwork"></div>
+<script>
+  var nodes = new vis.DataSet(__VIS_NODES__);
+  var edges = new vis.DataSet(__VIS_EDGES__);
+  new vis.Network(document.getElementById('mynetwork'), {nodes: nodes, edges: edges}, __VIS_OPTIONS__);
+</script>
+</body>
+</html>
+"""
 
-    if not PYVIS_AVAILABLE:
-        st.error("❌ Pyvis not available. Install with: pip install pyvis networkx")
-        return
+_VISJS_OPTIONS = {"physics": {"enabled": False}, "interaction": {"hover": True}}
 
-    st.subheader("🌐 Interactive Network Graph")
+def _to_script_json(value) -> str:
+    """JSON for inline <script> blocks, with "</" escaped so data cannot close the tag"""
+    if ORJSON_AVAILABLE:
+        text = orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY, default=str).decode('utf-8')
+    else:
+        text = json.dumps(value, ensure_ascii=False, default=str)
+    return text.replace("</", "<\\/")
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _style_subgraph(nodes_key: Tuple[str, ...], edges_key: Tuple[Tuple[str, str, str], ...],
+                    node_data_key: str) -> Tuple[List[Dict], List[Dict]]:
+    """Turn a subgraph into vis.js node/edge dicts with a precomputed layout"""
+    subgraph = {
+        'nodes': list(nodes_key),
+        'edges': [{'source': source, 'target': target, 'relationship': relationship}
+                  for source, target, relationship in edges_key],
+        'node_data': json.loads(node_data_key)
+    }
 
-    # Create pyvis network
-    net = Network(
-        height="600px",
-        width="100%",
-        bgcolor="#222222",
-        font_color="white",
-        directed=True
-    )
+    import networkx as nx
 
-    # Configure physics
-    net.set_options("""
-    var options = {
-      "physics": {
-        "enabled": true,
-        "stabilization": {"iterations": 100},
-        "barnesHut": {
-          "gravitationalConstant": -8000,
-          "centralGravity": 0.3,
-          "springLength": 95,
-          "springConstant": 0.04,
-          "damping": 0.09
-        }
-      }
-    }
-    """)
+    # Layout is computed here once, so the browser skips physics stabilization
+    pos = nx.spring_layout(create_networkx_graph(subgraph), seed=42, iterations=50)
 
     # Color scheme for different node types
     node_colors = {
@@ -893,10 +1262,10 @@ def render_pyvis_graph_visualization(subgraph: Dict, results: List[SearchResult]
         'author': '#FFEAA7'      # Yellow for authors
     }
 
-    # Add nodes with styling
+    # Style nodes
+    styled_nodes = []
     for node in subgraph['nodes']:
-        node_type = node.split(':', 1)[0]
-        node_id = node.split(':', 1)[1]
+        node_type, _, node_id = node.partition(':')
 
         # Get node data
         node_data = subgraph.get('node_data', {}).get(node, {})
@@ -928,43 +1297,97 @@ def render_pyvis_graph_visualization(subgraph: Dict, results: List[SearchResult]
             title = f"{node_type.title()}: {node_id}"
             size = 12
 
-        # Add node to network
-        net.add_node(
-            node,
-            label=label,
-            title=title,
-            color=node_colors.get(node_type, '#95A5A6'),
-            size=size,
-            font={'size': 12, 'color': 'white'}
-        )
+        styled_nodes.append({
+            'id': node,
+            'label': label,
+            'title': title,
+            'shape': 'dot',
+            'color': node_colors.get(node_type, '#95A5A6'),
+            'size': size,
+            'font': {'size': 12, 'color': 'white'},
+            'x': float(pos[node][0]) * 1000,
+            'y': float(pos[node][1]) * 1000,
+            'physics': False
+        })
+
+    # Edge styling based on relationship type
+    edge_colors = {
+        'MENTIONS': '#FF6B6B',
+        'COMMENTS_ON': '#4ECDC4',
+        'RELATES_TO': '#45B7D1',
+        'AUTHORED_BY': '#FFEAA7'
+    }
+    styled_edges = [
+        {
+            'from': edge['source'],
+            'to': edge['target'],
+            'label': edge['relationship'],
+            'color': edge_colors.get(edge['relationship'], '#95A5A6'),
+            'width': 2,
+            'arrows': {'to': {'enabled': True, 'scaleFactor': 1.2}}
+        }
+        for edge in subgraph['edges']
+    ]
 
-    # Add edges with styling
-    for edge in subgraph['edges']:
-        source = edge['source']
-        target = edge['target']
-        relationship = edge['relationship']
+    return styled_nodes, styled_edges
 
-        # Edge styling based on relationship type
-        edge_colors = {
-            'MENTIONS': '#FF6B6B',
-            'COMMENTS_ON': '#4ECDC4',
-            'RELATES_TO': '#45B7D1',
-            'AUTHORED_BY': '#FFEAA7'
-        }
+def _feed_pyvis(net, styled_nodes: List[Dict], styled_edges: List[Dict]):
+    """Load prebuilt vis.js node/edge dicts into a pyvis network"""
+    net.nodes.extend(styled_nodes)
+    net.edges.extend(styled_edges)
 
-        net.add_edge(
-            source,
-            target,
-            label=relationship,
-            color=edge_colors.get(relationship, '#95A5A6'),
-            width=2,
-            arrows={'to': {'enabled': True, 'scaleFactor': 1.2}}
-        )
+@st.cache_data(max_entries=32, show_spinner=False)
+def _build_pyvis_html(nodes_key: Tuple[str, ...], edges_key: Tuple[Tuple[str, str, str], ...],
+                      node_data_key: str, _styled_nodes: List[Dict], _styled_edges: List[Dict]) -> str:
+    """Build the network HTML for a subgraph, cached across reruns on the subgraph keys"""
+    styled_nodes, styled_edges = _styled_nodes, _styled_edges
+
+    # Small graphs skip pyvis and its template render entirely
+    if len(styled_nodes) < VISJS_TEMPLATE_NODE_LIMIT:
+        return (_VISJS_TEMPLATE
+                .replace("__VIS_NODES__", _to_script_json(styled_nodes))
+                .replace("__VIS_EDGES__", _to_script_json(styled_edges))
+                .replace("__VIS_OPTIONS__", _to_script_json(_VISJS_OPTIONS)))
+
+    from pyvis.network import Network
+
+    # Create pyvis network
+    net = Network(
+        height="600px",
+        width="100%",
+        bgcolor="#222222",
+        font_color="white",
+        directed=True
+    )
+    net.set_options("""
+    var options = {
+      "physics": {"enabled": false}
+    }
+    """)
+    _feed_pyvis(net, styled_nodes, styled_edges)
+    return net.generate_html()
+
+def render_pyvis_graph_visualization(subgraph: Dict, results: List[SearchResult], query: str):
+    """Render an interactive graph visualization using pyvis"""
+
+    if not PYVIS_AVAILABLE:
+        st.error("❌ Pyvis not available. Install with: pip install pyvis networkx")
+        return
+
+    st.subheader("🌐 Interactive Network Graph")
+
+    # Hashable subgraph keys and styled node/edge views, built once for every path below
+    graph_keys = (
+        tuple(subgraph['nodes']),
+        tuple((e['source'], e['target'], e['relationship']) for e in subgraph['edges']),
+        json.dumps(subgraph.get('node_data', {}), sort_keys=True, default=str)
+    )
+    styled_nodes, styled_edges = _style_subgraph(*graph_keys)
 
     # Generate and display the graph
     try:
-        # Save the graph as HTML
-        graph_html = net.generate_html()
+        # Build (or reuse) the graph HTML for this exact subgraph
+        graph_html = _build_pyvis_html(*graph_keys, styled_nodes, styled_edges)
 
         # Display in Streamlit
         st.components.v1.html(graph_html, height=650)
@@ -1018,17 +1441,9 @@ def render_pyvis_graph_visualization(subgraph: Dict, results: List[SearchResult]
             with col_exp2:
                 # Export as NetworkX graph data
                 if st.button("📊 Export NetworkX Data"):
-                    nx_graph = create_networkx_graph(subgraph)
-                    graph_data = {
-                        'nodes': list(nx_graph.nodes(data=True)),
-                        'edges': list(nx_graph.edges(data=True)),
-                        'query': query,
-                        'timestamp': datetime.now().isoformat()
-                    }
-
                     st.download_button(
                         label="📥 Download NetworkX JSON",
-                        data=json.dumps(graph_data, indent=2),
+                        data=_serialize_networkx_graph(create_networkx_graph(subgraph), query),
                         file_name=f"networkx_graph_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                         mime="application/json"
                     )
@@ -1044,12 +1459,13 @@ def create_networkx_graph(subgraph: Dict):
     if not NETWORKX_AVAILABLE:
         return None
 
+    import networkx as nx
+
     G = nx.DiGraph()
 
     # Add nodes with attributes
     for node in subgraph['nodes']:
-        node_type = node.split(':', 1)[0]
-        node_id = node.split(':', 1)[1]
+        node_type, _, node_id = node.partition(':')
         node_data = subgraph.get('node_data', {}).get(node, {})
 
         G.add_node(node,
@@ -1065,6 +1481,18 @@ def create_networkx_graph(subgraph: Dict):
 
     return G
 
+def _serialize_networkx_graph(nx_graph, query: str) -> bytes:
+    """Serialize a NetworkX graph export as compact JSON bytes"""
+    graph_data = {
+        'nodes': list(nx_graph.nodes(data=True)),
+        'edges': list(nx_graph.edges(data=True)),
+        'query': query,
+        'timestamp': datetime.now().isoformat()
+    }
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(graph_data, option=orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return json.dumps(graph_data, separators=(',', ':'), default=str).encode('utf-8')
+
 def show_graph_statistics(subgraph: Dict, results: List[SearchResult]):
     """Show detailed graph statistics"""
 
@@ -1076,33 +1504,28 @@ def show_graph_statistics(subgraph: Dict, results: List[SearchResult]):
     st.write(f"**Search Results:** {len(results)}")
 
     # Node type distribution
-    node_types = {}
-    for node in subgraph['nodes']:
-        node_type = node.split(':', 1)[0]
-        node_types[node_type] = node_types.get(node_type, 0) + 1
+    node_types = Counter(node.partition(':')[0] for node in subgraph['nodes'])
 
     st.markdown("**Node Distribution:**")
-    for node_type, count in node_types.items():
+    for node_type, count in node_types.most_common():
         percentage = (count / len(subgraph['nodes'])) * 100
         st.write(f"• {node_type.title()}: {count} ({percentage:.1f}%)")
 
     # School distribution
-    schools = set()
-    for result in results:
-        for commentary in result.commentaries:
-            schools.add(commentary.school)
+    schools = {commentary.school for result in results for commentary in result.commentaries}
 
     st.write(f"**Schools Represented:** {len(schools)}")
     for school in sorted(schools):
         st.write(f"• {school}")
 
-def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50):
-    """Create a focused subgraph for visualization"""
-    if not GRAPH_VIZ_AVAILABLE:
-        return None
+def _truncate(text: str, limit: int) -> str:
+    """Cut text to limit characters with a trailing ellipsis when shortened"""
+    return text[:limit] + "..." if len(text) > limit else text
 
-    # Create a subgraph with relevant nodes and metadata
-    nodes = []
+def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50):
+    """Create a focused subgraph for visualization without external dependencies"""
+    # Create a subgraph with relevant nodes and metadata; node_data keys double as
+    # the ordered, de-duplicated node list
     edges = []
     node_data = {}
 
@@ -1111,13 +1534,12 @@ def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50
 
         # Add verse node with metadata
         if verse_id not in node_data:
-            nodes.append(verse_id)
             node_data[verse_id] = {
                 'type': 'verse',
                 'id': result.verse.id,
                 'chapter': result.verse.chapter,
                 'verse': result.verse.verse,
-                'shloka': result.verse.shloka[:100] + "..." if len(result.verse.shloka) > 100 else result.verse.shloka,
+                'shloka': _truncate(result.verse.shloka, 100),
                 'score': result.score
             }
 
@@ -1125,7 +1547,6 @@ def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50
         for concept in result.related_concepts[:3]:
             concept_id = f"concept:{concept}"
             if concept_id not in node_data:
-                nodes.append(concept_id)
                 node_data[concept_id] = {
                     'type': 'concept',
                     'term': concept,
@@ -1141,13 +1562,12 @@ def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50
         for commentary in result.commentaries[:2]:
             commentary_id = f"commentary:{commentary.id}"
             if commentary_id not in node_data:
-                nodes.append(commentary_id)
                 node_data[commentary_id] = {
                     'type': 'commentary',
                     'id': commentary.id,
                     'school': commentary.school,
                     'author': commentary.original_author or commentary.substitute_author,
-                    'text_preview': commentary.text[:200] + "..." if len(commentary.text) > 200 else commentary.text
+                    'text_preview': _truncate(commentary.text, 200)
                 }
             edges.append({
                 'source': commentary_id,
@@ -1155,6 +1575,7 @@ def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50
                 'relationship': "COMMENTS_ON"
             })
 
+    nodes = list(node_data)
     return {
         'nodes': nodes,
         'edges': edges,
@@ -1163,69 +1584,14 @@ def create_subgraph_for_results(results: List[SearchResult], max_nodes: int = 50
         'total_edges': len(edges)
     }
 
-def create_subgraph_for_results_fallback(results: List[SearchResult], max_nodes: int = 50):
-    """Create a focused subgraph for visualization without external dependencies"""
-    # Create a subgraph with relevant nodes and metadata
-    nodes = []
-    edges = []
-    node_data = {}
+@st.cache_data(max_entries=32, show_spinner=False)
+def _cached_subgraph(result_key: Tuple, _results: List[SearchResult]):
+    """Subgraph for a result set, keyed by its (verse id, score) tuple so re-clicking Build reuses it"""
+    return create_subgraph_for_results(_results)
 
-    for result in results[:10]:  # Limit to top 10 results
-        verse_id = f"verse:{result.verse.id}"
-
-        # Add verse node with metadata
-        if verse_id not in node_data:
-            nodes.append(verse_id)
-            node_data[verse_id] = {
-                'type': 'verse',
-                'id': result.verse.id,
-                'chapter': result.verse.chapter,
-                'verse': result.verse.verse,
-                'shloka': result.verse.shloka[:100] + "..." if len(result.verse.shloka) > 100 else result.verse.shloka,
-                'score': result.score
-            }
-
-        # Add concept nodes
-        for concept in result.related_concepts[:3]:
-            concept_id = f"concept:{concept}"
-            if concept_id not in node_data:
-                nodes.append(concept_id)
-                node_data[concept_id] = {
-                    'type': 'concept',
-                    'term': concept,
-                    'id': concept
-                }
-            edges.append({
-                'source': verse_id,
-                'target': concept_id,
-                'relationship': "MENTIONS"
-            })
-
-        # Add commentary nodes
-        for commentary in result.commentaries[:2]:
-            commentary_id = f"commentary:{commentary.id}"
-            if commentary_id not in node_data:
-                nodes.append(commentary_id)
-                node_data[commentary_id] = {
-                    'type': 'commentary',
-                    'id': commentary.id,
-                    'school': commentary.school,
-                    'author': commentary.original_author or commentary.substitute_author,
-                    'text_preview': commentary.text[:200] + "..." if len(commentary.text) > 200 else commentary.text
-                }
-            edges.append({
-                'source': commentary_id,
-                'target': verse_id,
-                'relationship': "COMMENTS_ON"
-            })
-
-    return {
-        'nodes': nodes,
-        'edges': edges,
-        'node_data': node_data,
-        'total_nodes': len(nodes),
-        'total_edges': len(edges)
-    }
+def _subgraph_for_results(results: List[SearchResult]):
+    """Cached create_subgraph_for_results for the current results"""
+    return _cached_subgraph(tuple((r.verse.id, r.score) for r in results[:10]), results)
 
 def render_simple_node_list(subgraph: Dict):
     """Simple fallback visualization showing nodes and connections"""
@@ -1237,7 +1603,7 @@ def render_simple_node_list(subgraph: Dict):
         st.markdown("**Nodes:**")
         node_types = {}
         for node in subgraph['nodes']:
-            node_type = node.split(':', 1)[0]
+            node_type = node.partition(':')[0]
             node_types[node_type] = node_types.get(node_type, 0) + 1
             st.write(f"• {node}")
 
@@ -1248,8 +1614,8 @@ def render_simple_node_list(subgraph: Dict):
 
         st.markdown("**Connections:**")
         for edge in subgraph['edges'][:5]:
-            source_short = edge['source'].split(':', 1)[1][:15]
-            target_short = edge['target'].split(':', 1)[1][:15]
+            source_short = edge['source'].partition(':')[2][:15]
+            target_short = edge['target'].partition(':')[2][:15]
             st.write(f"• {source_short} → {target_short}")
 
         if len(subgraph['edges']) > 5:
@@ -1263,6 +1629,8 @@ def render_networkx_graph_visualization(subgraph: Dict, results: List[SearchResu
 
     st.subheader("🌐 NetworkX Graph Analysis")
 
+    import networkx as nx
+
     # Create NetworkX graph
     G = create_networkx_graph(subgraph)
     if G is None:
@@ -1286,35 +1654,43 @@ def render_networkx_graph_visualization(subgraph: Dict, results: List[SearchResu
     # Show graph structure
     render_simple_node_list(subgraph)
 
-def split_text_into_sentences(text: str, max_tokens: int = 200) -> List[str]:
-    """Split text into sentences or short snippets with token limit"""
+def split_text_into_sentences(text: str, max_tokens: int = 200) -> Iterator[str]:
+    """Yield sentences or short snippets with token limit"""
     if not text:
-        return []
+        return
 
     # Simple sentence splitting on periods, exclamation marks, and question marks
-    sentences = re.split(r'[.!?]+', text)
-    snippets = []
-
-    for sentence in sentences:
-        sentence = sentence.strip()
+    for match in _SENTENCE_RE.finditer(text):
+        sentence = match.group().strip()
         if not sentence:
             continue
 
-        # Rough token estimation (words * 1.3)
-        estimated_tokens = len(sentence.split()) * 1.3
+        # Rough token estimation (~4 characters per token)
+        estimated_tokens = len(sentence) * 0.25
 
         if estimated_tokens <= max_tokens:
-            snippets.append(sentence)
+            yield sentence
         else:
-            # Split long sentences into chunks
-            words = sentence.split()
-            chunk_size = int(max_tokens / 1.3)
-            for i in range(0, len(words), chunk_size):
-                chunk = ' '.join(words[i:i + chunk_size])
-                if chunk.strip():
-                    snippets.append(chunk.strip())
-
-    return snippets
+            # Split long sentences into chunks of at most max_tokens by the same estimate,
+            # backing off to the last space so words stay whole
+            chunk_size_chars = max_tokens * 4
+            start = 0
+            while start < len(sentence):
+                end = start + chunk_size_chars
+                if end < len(sentence):
+                    space = sentence.rfind(' ', start, end + 1)
+                    if space > start:
+                        end = space
+                chunk = sentence[start:end].strip()
+                if chunk:
+                    yield chunk
+                start = end
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def _encode_commentary_sentences(commentary_id: str, sentences: Tuple[str, ...], model_id: str, _model) -> np.ndarray:
+    """Embed one commentary's excerpt sentences; commentary text is static, so reuse them"""
+    # Ranking only needs the ordering, so half precision is plenty and halves the cache
+    return encode_many(_model, list(sentences)).astype(np.float16)
 
 def select_top_excerpts(commentaries_data: List[Dict], query: str, model,
                        max_excerpts: int = 16, max_per_school: int = 6) -> List[Dict]:
@@ -1335,11 +1711,9 @@ def select_top_excerpts(commentaries_data: List[Dict], query: str, model,
         if school_counts[school] >= max_per_school:
             continue
 
-        # Split into sentences/snippets
-        sentences = split_text_into_sentences(text)
-
-        for sentence in sentences:
-            if len(sentence.strip()) < 5:  # More lenient minimum length
+        # Split into sentences/snippets lazily so the school cap stops the scan early
+        for sentence in split_text_into_sentences(text):
+            if len(sentence) < 5:  # More lenient minimum length
                 continue
 
             excerpts.append({
@@ -1370,27 +1744,33 @@ def select_top_excerpts(commentaries_data: List[Dict], query: str, model,
 
     # Compute similarities with fallback
     try:
-        query_embedding = model.encode([query], normalize_embeddings=True)
-        excerpt_texts = [excerpt['text'] for excerpt in excerpts]
-        excerpt_embeddings = model.encode(excerpt_texts, normalize_embeddings=True)
+        # Query and sentences must be embedded by the same (possibly injected) model
+        model_id = _model_cache_id(model)
+        query_embedding = np.frombuffer(_encode_query(query, model_id, model), dtype=np.float32)
+        # Excerpts of one commentary are contiguous; embed each commentary's set once
+        # Upcast the stacked fp16 rows once; NumPy has no BLAS path for fp16 matmul
+        excerpt_embeddings = np.vstack([
+            _encode_commentary_sentences(commentary_id, tuple(excerpt['text'] for excerpt in group), model_id, model)
+            for commentary_id, group in itertools.groupby(excerpts, key=operator.itemgetter('id'))
+        ]).astype(np.float32)
 
         # Calculate cosine similarities
-        similarities = np.dot(excerpt_embeddings, query_embedding.T).flatten()
+        similarities = excerpt_embeddings @ query_embedding
 
         # Add similarity scores to excerpts
-        for i, excerpt in enumerate(excerpts):
-            excerpt['similarity'] = float(similarities[i])
+        for excerpt, similarity in zip(excerpts, similarities.tolist()):
+            excerpt['similarity'] = similarity
 
-        # Sort by similarity and take top N - more lenient threshold
-        excerpts.sort(key=lambda x: x['similarity'], reverse=True)
+        # Partially sort by similarity; keep enough for the low-score fallback too
+        ranked = heapq.nlargest(max(max_excerpts, 8), excerpts, key=operator.itemgetter('similarity'))
 
         # Take top excerpts but ensure we have at least some content
-        selected = excerpts[:max_excerpts]
+        selected = ranked[:max_excerpts]
 
         # If similarity scores are very low, still return some excerpts
         if not selected or (selected and selected[0]['similarity'] < 0.1):
             # Return top excerpts regardless of similarity score
-            return excerpts[:min(8, len(excerpts))]
+            return ranked[:8]
 
         return selected
 
@@ -1405,8 +1785,8 @@ def compute_hybrid_confidence(supporting_excerpts: List[Dict], total_schools: in
         return 0.0
 
     # Coverage (distinct schools)
-    distinct_schools = len(set(excerpt['school'] for excerpt in supporting_excerpts))
-    coverage = distinct_schools / min(total_schools, 4)
+    distinct_schools = len({excerpt['school'] for excerpt in supporting_excerpts})
+    coverage = distinct_schools / min(total_schools, COVERAGE_SCHOOL_CAP)
 
     # Support strength
     support_strength = support_count / N
@@ -1427,93 +1807,202 @@ def should_abstain(supporting_excerpts: List[Dict], support_count: int, N: int =
     """Always proceed - abstention logic removed"""
     return False
 
-def query_groq_api_aggregate(commentaries_data: List[Dict], query: str, api_key: str) -> Dict:
-    """
-    Aggregate commentary analysis with single grounded synthesis
+def _compress_log_text(text: str) -> str:
+    """Gzip + base64 a large log field; decode with gzip.decompress(base64.b64decode(value))"""
+    return base64.b64encode(gzip.compress(text.encode("utf-8"))).decode("ascii")
+
+def _dump_log_line(entry: Dict) -> bytes:
+    """Serialize one JSONL log line to UTF-8 bytes, via orjson when available"""
+    # The verbatim model response dwarfs the other fields; store it compressed
+    raw_content = entry.get("raw_model_output")
+    if isinstance(raw_content, str):
+        entry = {k: v for k, v in entry.items() if k != "raw_model_output"}
+        entry["raw_model_output_gz_b64"] = _compress_log_text(raw_content)
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(entry, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY, default=str)
+    return (json.dumps(entry, default=str) + "\n").encode("utf-8")
+
+def _drain_log_queue(log_queue: "queue.Queue[Dict]"):
+    """Append queued log entries to the JSONL file through one long-lived handle"""
+    pending = 0
+    with open(GROQ_LOG_FILE, "ab") as f:
+        while True:
+            try:
+                entry = log_queue.get(timeout=LOG_FLUSH_SECONDS)
+            except queue.Empty:
+                if pending:
+                    f.flush()
+                    pending = 0
+                continue
+            try:
+                f.write(_dump_log_line(entry))
+                pending += 1
+            except Exception:
+                # Skip entries that fail to serialize
+                pass
+            if pending >= LOG_FLUSH_EVERY:
+                f.flush()
+                pending = 0
 
-    Args:
-        commentaries_data: [{ "id": "C1", "school": "Sri Vaisnava Sampradaya", "text": "..." }, ...]
-        query: user question
-        api_key: GROQ API key
-    Returns:
-        JSON dict with keys: summary, direction, supporting_ids, supporting_schools, confidence_score, note
+@st.cache_resource
+def _log_queue() -> "queue.Queue[Dict]":
+    """Queue drained by a single writer thread, started once per process"""
+    log_queue = queue.Queue()
+    threading.Thread(target=_drain_log_queue, args=(log_queue,), name="gita-log-writer", daemon=True).start()
+    return log_queue
+
+@st.cache_resource
+def _groq_session() -> requests.Session:
+    """Keep-alive connection pool shared by every rerun, so repeat Groq calls skip the TLS handshake"""
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+def _format_excerpt_lines(excerpts: List[Dict], text_limit: int) -> str:
+    """One 'id | school | "text..."' prompt line per excerpt"""
+    return ''.join(
+        f"{excerpt['id']} | {excerpt['school']} | \"{excerpt['text'][:text_limit]}...\"\n"
+        for excerpt in excerpts
+    )
+
+def _build_excerpt_bundle(query: str, excerpts: List[Dict], text_limit: int) -> str:
+    """Format the question and id-tagged excerpts for the Groq prompt"""
+    return f'User question: "{query}"\nEXCERPTS:\n' + _format_excerpt_lines(excerpts, text_limit)
+
+def _validate_groq_result(result: Dict, selected_excerpts: List[Dict], total_schools: int) -> Tuple[List[Dict], Optional[float]]:
+    """Fix up a model summary in place against its excerpts; returns (supporting excerpts, model confidence)"""
+    # Post-validate fields
+    id_to_school = {excerpt['id']: excerpt['school'] for excerpt in selected_excerpts}
+    provided_ids = id_to_school.keys()
+
+    # Validate and fix fields
+    if 'direction' not in result or result['direction'] not in _ALLOWED_DIRECTIONS:
+        result['direction'] = 'mixed'
+
+    if 'supporting_ids' not in result or not isinstance(result['supporting_ids'], list):
+        result['supporting_ids'] = []
+    else:
+        # Filter to only provided IDs
+        result['supporting_ids'] = [id for id in result['supporting_ids'] if id in provided_ids]
+
+    if 'supporting_schools' not in result or not isinstance(result['supporting_schools'], list):
+        result['supporting_schools'] = []
+    else:
+        # Validate schools match the supporting IDs
+        result['supporting_schools'] = list({id_to_school[i] for i in result['supporting_ids']})
+
+    if 'confidence_score' not in result or not isinstance(result['confidence_score'], (int, float)):
+        result['confidence_score'] = 0.0
+    else:
+        result['confidence_score'] = max(0.0, min(1.0, float(result['confidence_score'])))
+
+    if 'summary' not in result:
+        result['summary'] = "INSUFFICIENT_GROUNDED_EVIDENCE"
+
+    if 'note' not in result:
+        result['note'] = "N/A"
+
+    # Compute hybrid confidence (average with model confidence if provided)
+    supporting_ids = frozenset(result['supporting_ids'])
+    supporting_excerpts = [e for e in selected_excerpts if e['id'] in supporting_ids]
+    model_confidence = result.get('confidence_score', None)
+
+    hybrid_confidence = compute_hybrid_confidence(
+        supporting_excerpts,
+        total_schools,
+        len(supporting_excerpts),
+        N=len(selected_excerpts),
+        model_confidence=model_confidence
+    )
+    result['confidence_score'] = hybrid_confidence
+
+    return supporting_excerpts, model_confidence
+
+def _insufficient_result(note: str) -> Dict:
+    """Summary placeholder used when no grounded synthesis is available"""
+    return {
+        "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
+        "direction": "insufficient_evidence",
+        "supporting_ids": [],
+        "supporting_schools": [],
+        "confidence_score": 0.0,
+        "note": note
+    }
+
+def _prepare_groq_aggregate(commentaries_data: List[Dict], query: str, api_key: str, model=None,
+                            total_schools: Optional[int] = None) -> Tuple[Optional[Dict], List[Dict], int]:
+    """Select excerpts for one aggregate call; returns (placeholder or None, excerpts, total schools)
+
+    Runs on the script thread: excerpt selection goes through the st.cache_data embedding
+    helpers, which need a ScriptRunContext, so pool workers only make the HTTP call.
     """
     if not api_key or not commentaries_data:
-        return {
-            "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-            "direction": "insufficient_evidence",
-            "supporting_ids": [],
-            "supporting_schools": [],
-            "confidence_score": 0.0,
-            "note": "No commentaries provided or API key missing."
-        }
+        return _insufficient_result("No commentaries provided or API key missing."), [], 0
 
-    # Load embedding model for excerpt selection
-    model = load_embedding_model()
+    # Load embedding model for excerpt selection unless the caller injected one
+    if model is None:
+        model = load_embedding_model()
     if not model:
-        return {
-            "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-            "direction": "insufficient_evidence",
-            "supporting_ids": [],
-            "supporting_schools": [],
-            "confidence_score": 0.0,
-            "note": "Failed to load embedding model for excerpt selection."
-        }
+        return _insufficient_result("Failed to load embedding model for excerpt selection."), [], 0
 
     # Step 1: Pre-call excerpt selection
     selected_excerpts = select_top_excerpts(commentaries_data, query, model)
 
     if not selected_excerpts:
-        return {
-            "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-            "direction": "insufficient_evidence",
-            "supporting_ids": [],
-            "supporting_schools": [],
-            "confidence_score": 0.0,
-            "note": f"No relevant excerpts found after selection from {len(commentaries_data)} commentaries."
-        }
+        return _insufficient_result(
+            f"No relevant excerpts found after selection from {len(commentaries_data)} commentaries."), [], 0
+
+    if total_schools is None:
+        total_schools = len({commentary['school'] for commentary in commentaries_data})
+    return None, selected_excerpts, total_schools
+
+def query_groq_api_aggregate(commentaries_data: List[Dict], query: str, api_key: str, model=None,
+                             total_schools: Optional[int] = None) -> Dict:
+    """
+    Aggregate commentary analysis with single grounded synthesis
 
+    Args:
+        commentaries_data: [{ "id": "C1", "school": "Sri Vaisnava Sampradaya", "text": "..." }, ...]
+        query: user question
+        api_key: GROQ API key
+        model: embedding model for excerpt selection (defaults to the cached loader)
+        total_schools: distinct schools in commentaries_data, if the caller already knows it
+    Returns:
+        JSON dict with keys: summary, direction, supporting_ids, supporting_schools, confidence_score, note
+    """
+    placeholder, selected_excerpts, total_schools = _prepare_groq_aggregate(
+        commentaries_data, query, api_key, model, total_schools)
+    if placeholder is not None:
+        return placeholder
+    return _call_groq_aggregate(selected_excerpts, query, api_key, total_schools)
+
+def _call_groq_aggregate(selected_excerpts: List[Dict], query: str, api_key: str, total_schools: int,
+                         session: Optional[requests.Session] = None,
+                         log_queue: Optional["queue.Queue[Dict]"] = None) -> Dict:
+    """Steps 2-9 of the aggregate synthesis: prompt, Groq call, validation and logging
+
+    Pool workers get session and log_queue passed in, so they touch no Streamlit cache.
+    """
+    if session is None:
+        session = _groq_session()
+    if log_queue is None:
+        log_queue = _log_queue()
     # Step 2: No abstention - proceed with all selected excerpts
     support_count = len(selected_excerpts)
 
     # Step 3: Construct prompt
     try:
         # Build excerpt bundle
-        excerpt_bundle = f'User question: "{query}"\nEXCERPTS:\n'
-        for excerpt in selected_excerpts:
-            excerpt_bundle += f"{excerpt['id']} | {excerpt['school']} | \"{excerpt['text'][:200]}...\"\n"
-
-        # Few-shot example
-        example = '''Example:
-User question: "What is dharma?"
-EXCERPTS:
-C1 | Sri Vaisnava Sampradaya | "Dharma means righteous duty according to one's station in life..."
-C2 | Advaita Vedanta | "Dharma is the eternal law that upholds cosmic order..."
-
-Expected JSON:
-{
-  "summary": "Dharma represents righteous duty and eternal law that maintains cosmic order according to one's life circumstances.",
-  "direction": "practical_action",
-  "supporting_ids": ["C1", "C2"],
-  "supporting_schools": ["Sri Vaisnava Sampradaya", "Advaita Vedanta"],
-  "confidence_score": 0.8,
-  "note": "Strong consensus across schools on dharma as duty and cosmic law."
-}'''
-
-        instruction = '''Instruction: You must respond with ONLY valid JSON. No other text. Produce JSON with these exact keys: summary (2-3 sentence synthesis to answer the user question), direction (practical_action|renunciation|devotional|mixed), supporting_ids (array of excerpt IDs used), supporting_schools (array of schools), confidence_score (0.0-1.0), note (short justification). Example format:
-{"summary": "Your synthesis here", "direction": "mixed", "supporting_ids": ["C1"], "supporting_schools": ["School Name"], "confidence_score": 0.8, "note": "Justification"}'''
+        excerpt_bundle = _build_excerpt_bundle(query, selected_excerpts, 200)
+        full_prompt = f"{_GROQ_EXAMPLE}\n\n{excerpt_bundle}\n{_GROQ_INSTRUCTION}"
 
-        full_prompt = f"{example}\n\n{excerpt_bundle}\n{instruction}"
-
-        # Check context length (rough estimation)
-        estimated_tokens = len(full_prompt.split()) * 1.3
+        # Check context length (rough estimation, ~4 characters per token)
+        estimated_tokens = len(full_prompt) * 0.25
         if estimated_tokens > 2800:  # Leave margin for response
             # Truncate excerpts if too long
             selected_excerpts = selected_excerpts[:6]
-            excerpt_bundle = f'User question: "{query}"\nEXCERPTS:\n'
-            for excerpt in selected_excerpts:
-                excerpt_bundle += f"{excerpt['id']} | {excerpt['school']} | \"{excerpt['text'][:150]}...\"\n"
-            full_prompt = f"{example}\n\n{excerpt_bundle}\n{instruction}"
+            excerpt_bundle = _build_excerpt_bundle(query, selected_excerpts, 150)
+            full_prompt = f"{_GROQ_EXAMPLE}\n\n{excerpt_bundle}\n{_GROQ_INSTRUCTION}"
 
         # Step 4: Model call
         headers = {
@@ -1526,7 +2015,7 @@ Expected JSON:
             'messages': [
                 {
                     'role': 'system',
-                    'content': 'You are a scholar of Hindu exegesis. Use only provided excerpts. Do not add facts or invent attributions. You must respond with ONLY valid JSON - no explanations, no markdown, no extra text. Just pure JSON.'
+                    'content': _GROQ_SYSTEM_MSG
                 },
                 {
                     'role': 'user',
@@ -1537,7 +2026,7 @@ Expected JSON:
             'temperature': 0.0  # Deterministic
         }
 
-        response = requests.post(
+        response = session.post(
             'https://api.groq.com/openai/v1/chat/completions',
             headers=headers,
             json=payload,
@@ -1553,39 +2042,20 @@ Expected JSON:
             elif response.status_code == 500:
                 error_note += " - Server error"
 
-            return {
-                "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-                "direction": "insufficient_evidence",
-                "supporting_ids": [],
-                "supporting_schools": [],
-                "confidence_score": 0.0,
-                "note": error_note
-            }
+            return _insufficient_result(error_note)
 
         raw_content = response.json()['choices'][0]['message']['content'].strip()
 
         # Step 5: JSON schema enforcement with better parsing
-        def extract_json_from_text(text):
-            """Extract JSON from text that might contain extra content"""
-            # Try to find JSON block
-            import re
-
-            # Look for JSON block between curly braces
-            json_match = re.search(r'\{.*\}', text, re.DOTALL)
-            if json_match:
-                return json_match.group(0)
-
-            # If no JSON found, return original text
-            return text
-
+        loads = orjson.loads if ORJSON_AVAILABLE else json.loads
         try:
             # First try direct parsing
-            result = json.loads(raw_content)
+            result = loads(raw_content)
         except json.JSONDecodeError:
             try:
-                # Try extracting JSON from the response
-                extracted_json = extract_json_from_text(raw_content)
-                result = json.loads(extracted_json)
+                # Try extracting the JSON block between curly braces from the response
+                json_match = _JSON_EXTRACT_RE.search(raw_content)
+                result = loads(json_match.group(0) if json_match else raw_content)
             except json.JSONDecodeError:
                 # Create a fallback response based on the excerpts
                 fallback_summary = f"Based on {len(selected_excerpts)} commentary excerpts, this verse addresses the question about {query.lower()}."
@@ -1599,54 +2069,9 @@ Expected JSON:
                     "note": f"Fallback response - model output was not valid JSON. Raw: {raw_content[:100]}..."
                 }
 
-        # Step 6: Post-validate fields
-        allowed_directions = {"practical_action", "renunciation", "devotional", "jnana", "mixed", "insufficient_evidence"}
-        provided_ids = set(excerpt['id'] for excerpt in selected_excerpts)
-
-        # Validate and fix fields
-        if 'direction' not in result or result['direction'] not in allowed_directions:
-            result['direction'] = 'mixed'
-
-        if 'supporting_ids' not in result or not isinstance(result['supporting_ids'], list):
-            result['supporting_ids'] = []
-        else:
-            # Filter to only provided IDs
-            result['supporting_ids'] = [id for id in result['supporting_ids'] if id in provided_ids]
-
-        if 'supporting_schools' not in result or not isinstance(result['supporting_schools'], list):
-            result['supporting_schools'] = []
-        else:
-            # Validate schools match the supporting IDs
-            valid_schools = set()
-            for excerpt in selected_excerpts:
-                if excerpt['id'] in result['supporting_ids']:
-                    valid_schools.add(excerpt['school'])
-            result['supporting_schools'] = list(valid_schools)
-
-        if 'confidence_score' not in result or not isinstance(result['confidence_score'], (int, float)):
-            result['confidence_score'] = 0.0
-        else:
-            result['confidence_score'] = max(0.0, min(1.0, float(result['confidence_score'])))
-
-        if 'summary' not in result:
-            result['summary'] = "INSUFFICIENT_GROUNDED_EVIDENCE"
-
-        if 'note' not in result:
-            result['note'] = "N/A"
-
-        # Step 7: Compute hybrid confidence (average with model confidence if provided)
-        total_schools = len(set(commentary['school'] for commentary in commentaries_data))
-        supporting_excerpts = [e for e in selected_excerpts if e['id'] in result['supporting_ids']]
-        model_confidence = result.get('confidence_score', None)
-
-        hybrid_confidence = compute_hybrid_confidence(
-            supporting_excerpts,
-            total_schools,
-            len(supporting_excerpts),
-            N=len(selected_excerpts),
-            model_confidence=model_confidence
-        )
-        result['confidence_score'] = hybrid_confidence
+        # Steps 6-7: Post-validate fields and compute hybrid confidence
+        supporting_excerpts, model_confidence = _validate_groq_result(result, selected_excerpts, total_schools)
+        hybrid_confidence = result['confidence_score']
 
         # Step 8: No abstention check - always proceed with result
 
@@ -1664,10 +2089,9 @@ Expected JSON:
             "final_result": result
         }
 
-        # Save to log file (append mode)
+        # Hand the entry to the background log writer (append mode)
         try:
-            with open("groq_aggregate_logs.jsonl", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry) + "\n")
+            log_queue.put_nowait(log_entry)
         except Exception:
             # Don't fail the main function if logging fails
             pass
@@ -1675,18 +2099,196 @@ Expected JSON:
         return result
 
     except Exception as e:
-        return {
-            "summary": "INSUFFICIENT_GROUNDED_EVIDENCE",
-            "direction": "insufficient_evidence",
-            "supporting_ids": [],
-            "supporting_schools": [],
-            "confidence_score": 0.0,
-            "note": f"Error during processing: {str(e)}"
-        }
+        return _insufficient_result(f"Error during processing: {str(e)}")
+
+def query_groq_api_aggregate_batch(per_verse_commentaries: List[Tuple[List[Dict], str]], api_key: str) -> List[Dict]:
+    """Run independent aggregate calls concurrently, returning results in input order"""
+    if not per_verse_commentaries:
+        return []
+    # Resolve the model once, and select excerpts here on the script thread; workers only call Groq
+    model = load_embedding_model()
+    prepared = [_prepare_groq_aggregate(commentaries_data, query, api_key, model)
+                for commentaries_data, query in per_verse_commentaries]
+    session, log_queue = _groq_session(), _log_queue()
+    futures = [
+        None if placeholder is not None
+        else _groq_pool().submit(_call_groq_aggregate, selected_excerpts, query, api_key, total_schools,
+                                 session, log_queue)
+        for (placeholder, selected_excerpts, total_schools), (_, query) in zip(prepared, per_verse_commentaries)
+    ]
+    return [placeholder if future is None else future.result()
+            for (placeholder, _, _), future in zip(prepared, futures)]
+
+def query_groq_batch(verse_commentaries_list: List[Tuple[str, List[Dict]]], query: str, api_key: str,
+                     model=None) -> Dict[str, Dict]:
+    """Summarize several verses with a single Groq call that returns a JSON array, keyed by verse id
+
+    Verses the call could not settle (API or parse errors, no entry in the response) are
+    left out of the result so the caller can retry them one by one.
+    """
+    if not api_key or not verse_commentaries_list:
+        return {}
+
+    if model is None:
+        model = load_embedding_model()
+    if not model:
+        return {verse_id: _insufficient_result("Failed to load embedding model for excerpt selection.")
+                for verse_id, _ in verse_commentaries_list}
+
+    # Per-verse excerpt selection, smaller than the single-verse path to keep one prompt in budget
+    summaries = {}
+    selected = {}
+    total_schools = {}
+    for verse_id, commentaries_data in verse_commentaries_list:
+        excerpts = select_top_excerpts(commentaries_data, query, model,
+                                       max_excerpts=GROQ_BATCH_EXCERPTS_PER_VERSE)
+        if excerpts:
+            selected[verse_id] = excerpts
+            total_schools[verse_id] = len({commentary['school'] for commentary in commentaries_data})
+        else:
+            summaries[verse_id] = _insufficient_result(
+                f"No relevant excerpts found after selection from {len(commentaries_data)} commentaries.")
+    if not selected:
+        return summaries
 
+    full_prompt = f'User question: "{query}"\n' + ''.join(
+        f"\nVERSE {verse_id}\nEXCERPTS:\n{_format_excerpt_lines(excerpts, 150)}"
+        for verse_id, excerpts in selected.items()
+    ) + f"\n{_GROQ_BATCH_INSTRUCTION}"
 
+    try:
+        response = _groq_session().post(
+            'https://api.groq.com/openai/v1/chat/completions',
+            headers={
+                'Authorization': f'Bearer {api_key}',
+                'Content-Type': 'application/json'
+            },
+            json={
+                'model': 'llama-3.1-8b-instant',
+                'messages': [
+                    {'role': 'system', 'content': _GROQ_SYSTEM_MSG},
+                    {'role': 'user', 'content': full_prompt}
+                ],
+                'max_tokens': min(300 * len(selected), 4096),
+                'temperature': 0.0  # Deterministic
+            },
+            timeout=30
+        )
+        if response.status_code != 200:
+            return summaries
 
-def render_search_result_minimal(result: SearchResult, result_num: int, enable_groq: bool = False, groq_api_key: str = ""):
+        raw_content = response.json()['choices'][0]['message']['content'].strip()
+        loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+        try:
+            parsed = loads(raw_content)
+        except json.JSONDecodeError:
+            json_match = _JSON_ARRAY_EXTRACT_RE.search(raw_content)
+            parsed = loads(json_match.group(0)) if json_match else []
+        if isinstance(parsed, dict):
+            parsed = parsed.get('summaries', [parsed])
+
+        for item in parsed if isinstance(parsed, list) else []:
+            verse_id = str(item.get('verse_id', '')) if isinstance(item, dict) else ''
+            if verse_id in selected and verse_id not in summaries:
+                _validate_groq_result(item, selected[verse_id], total_schools[verse_id])
+                item.pop('verse_id', None)
+                summaries[verse_id] = item
+
+        try:
+            _log_queue().put_nowait({
+                "timestamp": datetime.now().isoformat(),
+                "query": query,
+                "batch_verse_ids": list(selected),
+                "raw_model_output": raw_content,
+                "final_result": summaries
+            })
+        except Exception:
+            # Don't fail the main function if logging fails
+            pass
+    except Exception:
+        # Whatever was parsed before the failure stands; the rest is retried per verse
+        pass
+    return summaries
+
+def summarize_verses(verse_commentaries_list: List[Tuple[str, List[Dict]]], query: str, api_key: str) -> Dict[str, Dict]:
+    """One batched Groq call for all verses, then concurrent per-verse calls for any it missed"""
+    summaries = query_groq_batch(verse_commentaries_list, query, api_key)
+    missed = [(verse_id, commentaries_data) for verse_id, commentaries_data in verse_commentaries_list
+              if verse_id not in summaries]
+    if missed:
+        retried = query_groq_api_aggregate_batch(
+            [(commentaries_data, query) for _, commentaries_data in missed], api_key)
+        summaries.update(zip((verse_id for verse_id, _ in missed), retried))
+    return summaries
+
+@st.cache_resource(max_entries=2048, show_spinner=False)
+def _prepare_groq_commentaries(verse_id: str, _commentaries: List[CommentaryNode]) -> Tuple[List[Dict], int]:
+    """Commentaries of a verse in the Groq input shape plus their school count, built once per verse"""
+    verse_commentaries = []
+    verse_schools = set()
+    for i, commentary in enumerate(_commentaries):
+        if commentary.stripped_len > 10:
+            verse_commentaries.append({
+                'id': f"C{i+1}",
+                'school': commentary.school,
+                'text': commentary.text
+            })
+            verse_schools.add(commentary.school)
+    return verse_commentaries, len(verse_schools)
+
+def _groq_commentaries(result: SearchResult) -> Tuple[List[Dict], int]:
+    """Shared, read-only Groq commentary list for a search result"""
+    return _prepare_groq_commentaries(result.verse.id, result.commentaries)
+
+@st.cache_resource
+def _groq_pool() -> ThreadPoolExecutor:
+    """Process-wide worker pool for queued per-verse summaries"""
+    return ThreadPoolExecutor(max_workers=GROQ_MAX_WORKERS, thread_name_prefix="gita-groq")
+
+def _queue_verse_summary(result: SearchResult, query: str, api_key: str, is_free_trial: bool):
+    """Submit one verse summary to the worker pool; _poll_pending_summaries collects it"""
+    verse_commentaries, total_schools = _groq_commentaries(result)
+    if not verse_commentaries:
+        st.error("No valid commentaries found for this verse")
+        return
+    pending = st.session_state.setdefault('pending_summaries', {})
+    # Usage is counted when a successful summary comes back; until then the summary
+    # holds its use (see free_trial_uses_left) so the trial can't be overdrawn
+    if is_free_trial and not can_use_free_trial(get_user_id()):
+        st.warning("🚫 Free trial exhausted. Add your own API key to continue.")
+        return
+    # Excerpt selection needs the script thread (st.cache_data); the worker only calls Groq
+    placeholder, selected_excerpts, total_schools = _prepare_groq_aggregate(
+        verse_commentaries, query, api_key, load_embedding_model(), total_schools)
+    if placeholder is not None:
+        st.session_state.verse_summaries[result.verse.id] = placeholder
+        return
+    future = _groq_pool().submit(_call_groq_aggregate, selected_excerpts, query, api_key, total_schools,
+                                 _groq_session(), _log_queue())
+    pending[result.verse.id] = (future, is_free_trial)
+
+@st.fragment(run_every=2)
+def _poll_pending_summaries():
+    """Move finished queued summaries into verse_summaries and rerun the app to show them"""
+    pending = st.session_state.get('pending_summaries', {})
+    done = [verse_id for verse_id, (future, _) in pending.items() if future.done()]
+    for verse_id in done:
+        future, is_free_trial = pending.pop(verse_id)
+        try:
+            summary = future.result()
+        except Exception as e:
+            summary = _insufficient_result(f"Error during processing: {str(e)}")
+        # Session state (and so the user id) is only reachable here, not in the worker
+        if is_free_trial and _is_grounded_summary(summary):
+            increment_user_usage(get_user_id())
+        st.session_state.verse_summaries[verse_id] = summary
+    if done:
+        st.rerun()
+    elif pending:
+        st.caption(f"⏳ {len(pending)} queued summaries in progress...")
+
+def render_search_result_minimal(result: SearchResult, result_num: int, enable_groq: bool = False, groq_api_key: str = "",
+                                 is_free_trial: bool = False, last_query: str = ""):
     """Render search result in minimal format with optional AI summary generation"""
     verse = result.verse
 
@@ -1719,28 +2321,19 @@ def render_search_result_minimal(result: SearchResult, result_num: int, enable_g
                 try:
                     with st.spinner(f"Generating AI summary for verse {verse.id}..."):
                         # Collect commentaries for this specific verse
-                        verse_commentaries = []
-                        for i, commentary in enumerate(result.commentaries):
-                            if commentary.text and len(commentary.text.strip()) > 10:
-                                verse_commentaries.append({
-                                    'id': f"C{i+1}",
-                                    'school': commentary.school,
-                                    'text': commentary.text
-                                })
+                        verse_commentaries, total_schools = _groq_commentaries(result)
 
                         if verse_commentaries:
                             # Generate summary for this specific verse
-                            is_free_trial = st.session_state.get('using_free_trial', False)
                             verse_summary = query_groq_with_usage_tracking(
                                 verse_commentaries,
-                                st.session_state.get('last_query', ''),
+                                last_query,
                                 groq_api_key,
-                                is_free_trial
+                                is_free_trial,
+                                total_schools=total_schools
                             )
 
                             # Store in session state
-                            if 'verse_summaries' not in st.session_state:
-                                st.session_state.verse_summaries = {}
                             st.session_state.verse_summaries[verse.id] = verse_summary
 
                             # Show success/failure message
@@ -1765,8 +2358,15 @@ def render_search_result_minimal(result: SearchResult, result_num: int, enable_g
                     st.error(f"Error generating summary: {str(e)}")
                     # Don't rerun on error to avoid infinite loops
 
+            # Background alternative: several queued summaries overlap on network I/O
+            if verse.id in st.session_state.get('pending_summaries', {}):
+                st.caption("⏳ Summary queued")
+            elif st.button("Queue Summary", key=f"queue_summary_{verse.id}_{result_num}"):
+                _queue_verse_summary(result, last_query, groq_api_key, is_free_trial)
+                st.rerun()
+
     # Display per-verse AI summary if available
-    verse_summaries = st.session_state.get('verse_summaries', {})
+    verse_summaries = st.session_state.verse_summaries
     if verse.id in verse_summaries:
         verse_summary = verse_summaries[verse.id]
         if verse_summary.get('summary') != "INSUFFICIENT_GROUNDED_EVIDENCE":
@@ -1775,17 +2375,16 @@ def render_search_result_minimal(result: SearchResult, result_num: int, enable_g
 
                 direction = verse_summary.get('direction', 'N/A')
                 if direction != 'N/A':
-                    st.markdown(f"**Direction:** {direction.replace('_', ' ').title()}")
+                    label = _DIRECTION_LABEL.get(direction) or direction.replace('_', ' ').title()
+                    st.markdown(f"**Direction:** {label}")
 
                 confidence = verse_summary.get('confidence_score', 0)
                 if confidence > 0:
                     # Color-coded confidence display
-                    if confidence >= 0.7:
-                        st.success(f"**Confidence:** {confidence:.2f} (High)")
-                    elif confidence >= 0.4:
-                        st.warning(f"**Confidence:** {confidence:.2f} (Medium)")
-                    else:
-                        st.error(f"**Confidence:** {confidence:.2f} (Low)")
+                    for floor, level, show in _CONFIDENCE_BUCKETS:
+                        if confidence >= floor:
+                            show(f"**Confidence:** {confidence:.2f} ({level})")
+                            break
 
                 supporting_schools = verse_summary.get('supporting_schools', [])
                 if supporting_schools:
@@ -1819,16 +2418,8 @@ def render_search_result_minimal(result: SearchResult, result_num: int, enable_g
                 if commentary.original_author:
                     st.markdown(f"*Author:* {commentary.original_author}")
 
-                # Full text toggle
-                show_key = f"show_full_{verse.id}_{commentary.school}_{result_num}"
-                if show_key not in st.session_state:
-                    st.session_state[show_key] = False
-
-                if st.button(f"{'Hide' if st.session_state[show_key] else 'Show'} Full Text",
-                           key=f"btn_{show_key}"):
-                    st.session_state[show_key] = not st.session_state[show_key]
-
-                if st.session_state[show_key]:
+                # Full text reveal (expanders can't nest, so a popover; no session_state key needed)
+                with st.popover("Full Text"):
                     st.markdown(commentary.text)
 
                 st.markdown("---")
@@ -1849,8 +2440,7 @@ def main():
         st.session_state.search_performed = False
     if 'current_results' not in st.session_state:
         st.session_state.current_results = []
-    if 'verse_summaries' not in st.session_state:
-        st.session_state.verse_summaries = {}
+    st.session_state.setdefault('verse_summaries', {})
     if 'kg_built' not in st.session_state:
         st.session_state.kg_built = False
     if 'index_ready' not in st.session_state:
@@ -1926,19 +2516,47 @@ def main():
 
             # Option to use own API key
             st.markdown("**Or use your own API key:**")
-            groq_api_key_input = st.text_input("GROQ API Key", type="password",
-                                             help="Get a free API key from https://console.groq.com/")
-            if groq_api_key_input:
-                groq_api_key = groq_api_key_input
+            # In a form, so typing the key does not rerun (and re-render) the whole page
+            with st.form("apikey_form"):
+                groq_api_key_input = st.text_input("GROQ API Key", type="password",
+                                                 help="Get a free API key from https://console.groq.com/")
+                save_api_key = st.form_submit_button("Save API Key")
+            if save_api_key:
+                if groq_api_key_input:
+                    st.session_state.using_free_trial = False
+                    st.session_state.groq_api_key = groq_api_key_input
+                elif not st.session_state.get('using_free_trial', False):
+                    st.session_state.pop('groq_api_key', None)
+            if not st.session_state.get('using_free_trial', False) and st.session_state.get('groq_api_key'):
+                groq_api_key = st.session_state.groq_api_key
                 using_free_trial = False
-                st.session_state.using_free_trial = False
-                st.session_state.groq_api_key = groq_api_key_input
 
             if not groq_api_key:
                 if remaining_uses > 0:
                     st.info("💡 Click 'Use Free Trial' above or add your own GROQ API key.")
                 else:
                     st.info("💡 Add your GROQ API key to continue using AI summaries.")
+
+            # One batched Groq call for every displayed verse; per-verse buttons remain as fallback
+            current_results = st.session_state.get('current_results', [])
+            if groq_api_key and current_results:
+                if st.button("🤖 Generate all summaries", key="generate_all_summaries", use_container_width=True):
+                    batch_input = [(result.verse.id, _groq_commentaries(result)[0])
+                                   for result in current_results if result.commentaries]
+                    uses_left = free_trial_uses_left(get_user_id()) if using_free_trial else len(batch_input)
+                    if uses_left == 0:
+                        st.warning("🚫 Free trial exhausted. Add your own API key to continue.")
+                    else:
+                        # Each verse summary is one free-trial use, so only summarize as many as remain
+                        if len(batch_input) > uses_left:
+                            st.info(f"🎁 Free trial: summarizing the top {uses_left} verses only.")
+                            batch_input = batch_input[:uses_left]
+                        with st.spinner(f"Generating AI summaries for {len(batch_input)} verses..."):
+                            summaries = summarize_verses(batch_input, st.session_state.get('last_query', ''), groq_api_key)
+                        grounded = sum(map(_is_grounded_summary, summaries.values()))
+                        if using_free_trial and grounded:
+                            increment_user_usage(get_user_id(), min(grounded, uses_left))
+                        st.session_state.verse_summaries.update(summaries)
         
 
         
@@ -1984,7 +2602,8 @@ def main():
                 num_results,
                 st.session_state.index,
                 st.session_state.mappings,
-                st.session_state.kg_data
+                st.session_state.kg_data,
+                st.session_state.get('faiss_search_knob')
             )
 
             st.session_state.current_results = results
@@ -1999,6 +2618,13 @@ def main():
     # Display results
     if st.session_state.search_performed and st.session_state.current_results:
         results = st.session_state.current_results
+        # Read once here rather than once per rendered verse
+        is_free_trial = st.session_state.get('using_free_trial', False)
+        last_query = st.session_state.get('last_query', '')
+
+        # Collect any queued summaries that finished in the background
+        if st.session_state.get('pending_summaries'):
+            _poll_pending_summaries()
         
         # Individual AI summaries are now generated per-verse using buttons in each result
         if enable_groq and groq_api_key and results:
@@ -2013,7 +2639,7 @@ def main():
             with tab1:
                 st.subheader("Search Results")
                 for i, result in enumerate(results, 1):
-                    render_search_result_minimal(result, i, enable_groq, groq_api_key)
+                    render_search_result_minimal(result, i, enable_groq, groq_api_key, is_free_trial, last_query)
                     st.markdown("---")
 
             with tab2:
@@ -2035,7 +2661,7 @@ def main():
                 if st.button("🔍 Build Knowledge Graph"):
                     with st.spinner("Building knowledge graph..."):
                         # Create subgraph regardless of visualization libraries
-                        subgraph = create_subgraph_for_results_fallback(results)
+                        subgraph = _subgraph_for_results(results)
                         if subgraph:
                             st.success(f"Built subgraph with {len(subgraph['nodes'])} nodes and {len(subgraph['edges'])} connections")
 
@@ -2064,7 +2690,7 @@ def main():
             # Simple results display
             st.subheader("📖 Search Results")
             for i, result in enumerate(results, 1):
-                render_search_result_minimal(result, i, enable_groq, groq_api_key)
+                render_search_result_minimal(result, i, enable_groq, groq_api_key, is_free_trial, last_query)
                 if i < len(results):
                     st.markdown("---")
 
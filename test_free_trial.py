@@ -4,51 +4,46 @@ Test script for the free trial functionality
 """
 
 import json
-import os
+import sqlite3
 import uuid
+from contextlib import closing
 from datetime import datetime
 
 # Configuration
 FREE_TRIAL_USES = 3
-USAGE_TRACKING_FILE = "usage_tracking.json"
+USAGE_DB_FILE = "usage_tracking.db"
 
-def load_usage_data():
-    """Load usage tracking data from file"""
-    try:
-        if os.path.exists(USAGE_TRACKING_FILE):
-            with open(USAGE_TRACKING_FILE, 'r') as f:
-                return json.load(f)
-    except Exception:
-        pass
-    return {}
+def _usage_db():
+    """Open a connection to the usage tracking database"""
+    return sqlite3.connect(USAGE_DB_FILE, timeout=10)
 
-def save_usage_data(usage_data):
-    """Save usage tracking data to file"""
-    try:
-        with open(USAGE_TRACKING_FILE, 'w') as f:
-            json.dump(usage_data, f, indent=2)
-    except Exception:
-        pass
+def init_usage_db():
+    """Create the usage table in WAL mode"""
+    with closing(_usage_db()) as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage("
+            "user_id TEXT PRIMARY KEY, count INTEGER NOT NULL, first_use TEXT, last_use TEXT)"
+        )
+        conn.commit()
 
 def get_user_usage_count(user_id):
     """Get the current usage count for a user"""
-    usage_data = load_usage_data()
-    return usage_data.get(user_id, {}).get('usage_count', 0)
+    with closing(_usage_db()) as conn:
+        row = conn.execute("SELECT count FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
 
 def increment_user_usage(user_id):
     """Increment usage count for a user"""
-    usage_data = load_usage_data()
-    if user_id not in usage_data:
-        usage_data[user_id] = {
-            'usage_count': 0,
-            'first_use': datetime.now().isoformat(),
-            'last_use': datetime.now().isoformat()
-        }
-    
-    usage_data[user_id]['usage_count'] += 1
-    usage_data[user_id]['last_use'] = datetime.now().isoformat()
-    save_usage_data(usage_data)
-    return usage_data[user_id]['usage_count']
+    now = datetime.now().isoformat()
+    with closing(_usage_db()) as conn, conn:
+        conn.execute(
+            "INSERT INTO usage(user_id, count, first_use, last_use) VALUES (?, 1, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET count = count + 1, last_use = excluded.last_use",
+            (user_id, now, now)
+        )
+        row = conn.execute("SELECT count FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0]
 
 def can_use_free_trial(user_id):
     """Check if user can still use free trial"""
@@ -64,6 +59,7 @@ def test_free_trial_system():
     """Test the free trial system"""
     print("Testing Free Trial System")
     print("=" * 40)
+    init_usage_db()
     
     # Create a test user
     test_user_id = str(uuid.uuid4())
@@ -89,10 +85,13 @@ def test_free_trial_system():
     print(f"Can use free trial: {can_use_free_trial(test_user_id)}")
     print(f"Remaining uses: {get_remaining_free_uses(test_user_id)}")
     
-    # Show usage data file
-    print("\nUsage data file contents:")
-    usage_data = load_usage_data()
-    print(json.dumps(usage_data, indent=2))
+    # Show this user's usage row
+    print("\nUsage row:")
+    with closing(_usage_db()) as conn:
+        row = conn.execute(
+            "SELECT user_id, count, first_use, last_use FROM usage WHERE user_id = ?", (test_user_id,)
+        ).fetchone()
+    print(json.dumps(dict(zip(("user_id", "usage_count", "first_use", "last_use"), row)), indent=2))
 
 if __name__ == "__main__":
     test_free_trial_system()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for batched Groq summaries and the per-verse fallback
+"""
+
+import threading
+import time
+
+import main
+
+def _fake_select(selections):
+    """Stand-in for select_top_excerpts that records the selecting thread"""
+    def select(commentaries_data, query, model, max_excerpts=10):
+        selections.append((commentaries_data[0]['id'], threading.current_thread().name))
+        return [{"id": "C1", "school": "School A", "text": commentaries_data[0]['id'], "similarity": 0.5}]
+    return select
+
+def _fake_call(calls):
+    """Stand-in for _call_groq_aggregate that records the worker thread per call"""
+    def call(selected_excerpts, query, api_key, total_schools, session=None, log_queue=None):
+        time.sleep(0.05)
+        calls.append((selected_excerpts[0]['text'], threading.current_thread().name))
+        return {"summary": f"summary of {selected_excerpts[0]['text']}", "note": query}
+    return call
+
+def test_summarize_verses_retries_missed_verses_concurrently():
+    """Verses the single batched call misses are summarized by concurrent per-verse calls"""
+    print("Testing batched summaries with per-verse fallback")
+    print("=" * 40)
+    selections, calls = [], []
+    originals = (main.query_groq_batch, main.select_top_excerpts, main._call_groq_aggregate,
+                 main.load_embedding_model)
+    main.query_groq_batch = lambda verses, query, api_key: {"2:47": {"summary": "batched 2:47"}}
+    main.select_top_excerpts = _fake_select(selections)
+    main._call_groq_aggregate = _fake_call(calls)
+    main.load_embedding_model = lambda: object()
+    try:
+        verses = [(verse_id, [{"id": verse_id, "school": "School A", "text": "text"}])
+                  for verse_id in ("2:47", "3:19", "4:18", "18:66")]
+        summaries = main.summarize_verses(verses, "What is karma?", "key")
+    finally:
+        (main.query_groq_batch, main.select_top_excerpts, main._call_groq_aggregate,
+         main.load_embedding_model) = originals
+
+    for verse_id, summary in summaries.items():
+        print(f"{verse_id}: {summary['summary']}")
+    print(f"Excerpt selection: {selections}")
+    print(f"Fallback calls: {calls}")
+
+    assert list(summaries) == ["2:47", "3:19", "4:18", "18:66"]
+    assert summaries["2:47"]["summary"] == "batched 2:47"
+    # Only the missed verses are retried, each with its own results in input order
+    assert sorted(verse_id for verse_id, _ in calls) == ["18:66", "3:19", "4:18"]
+    for verse_id in ("3:19", "4:18", "18:66"):
+        assert summaries[verse_id] == {"summary": f"summary of {verse_id}", "note": "What is karma?"}
+    # Excerpts (cached embeddings) are selected on the calling thread; workers only call Groq
+    main_thread = threading.current_thread().name
+    assert all(thread == main_thread for _, thread in selections)
+    assert all(thread.startswith("gita-groq") for _, thread in calls)
+
+if __name__ == "__main__":
+    test_summarize_verses_retries_missed_verses_concurrently()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test script for knowledge graph loading and verse ranking
+"""
+
+import json
+import os
+import tempfile
+
+import main
+
+def _write_kg(chapters):
+    """Write a minimal bhagavad_gita data file and return its path"""
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"bhagavad_gita": chapters}, f)
+    return path
+
+def _verse(verse_num, commentaries=None, word_meaning=None):
+    return {
+        "verse": verse_num,
+        "shloka": f"shloka {verse_num}",
+        "word_meaning": word_meaning or {},
+        "commentaries": commentaries or {},
+    }
+
+def test_duplicated_verse_indexes_one_commentary_per_id():
+    """A verse listed twice keeps one (the latest) commentary per school"""
+    print("Testing duplicated verse commentary index")
+    print("=" * 40)
+    first = {
+        "School A": {"status": "original", "text": "first text A"},
+        "School B": {"status": "original", "text": "first text B"},
+    }
+    second = {
+        "School A": {"status": "original", "text": "second text A"},
+        "School B": {"status": "original", "text": "second text B"},
+    }
+    path = _write_kg([{"chapter": 1, "verses": [_verse(1, first), _verse(2), _verse(1, second)]}])
+    try:
+        kg_data = main.load_knowledge_graph_data(path)
+    finally:
+        os.remove(path)
+
+    indexed = kg_data["commentaries_by_verse"]["1:1"]
+    print(f"Commentaries: {len(kg_data['commentaries'])}, indexed for 1:1: {len(indexed)}")
+    assert len(indexed) == 2
+    assert sorted(c.text for c in indexed) == ["second text A", "second text B"]
+    assert all(kg_data["commentaries"][c.id] is c for c in indexed)
+    assert "1:2" not in kg_data["commentaries_by_verse"]
+
+def test_concept_mentioning_a_verse_twice():
+    """Every mention of a verse counts toward its score, but the concept is listed once"""
+    print("Testing concept with a repeated verse mention")
+    print("=" * 40)
+    karma = {"karma": "action"}
+    path = _write_kg([{"chapter": 2, "verses": [_verse(1, word_meaning=karma), _verse(2, word_meaning=karma),
+                                                _verse(1, word_meaning=karma)]}])
+    try:
+        kg_data = main.load_knowledge_graph_data(path)
+    finally:
+        os.remove(path)
+    assert kg_data["concepts"]["karma"].mentioned_in == ["2:1", "2:2", "2:1"]
+
+    mappings = {"id_to_node": {0: "concept:karma"}}
+    main._index_node_ids(mappings)
+    # The same concept hit twice should not count as two distinct concepts
+    results = main._rank_candidates([0.5, 0.5], [0, 0], 5, mappings, kg_data)
+    by_verse = {result.verse.id: result for result in results}
+    for verse_id, result in by_verse.items():
+        print(f"{verse_id}: score={result.score:.3f} support={result.support_count} concepts={result.related_concepts}")
+
+    # Matches the per-mention loop: 2:1 gets two mentions per hit, 2:2 one
+    assert by_verse["2:1"].support_count == 4
+    assert by_verse["2:2"].support_count == 2
+    assert by_verse["2:1"].related_concepts == ["karma"]
+    assert by_verse["2:2"].related_concepts == ["karma"]
+    assert abs(by_verse["2:1"].score - (0.4 + 0.1 + 0.2)) < 1e-6
+    assert abs(by_verse["2:2"].score - (0.4 + 0.1 + 0.1)) < 1e-6
+    assert [result.verse.id for result in results] == ["2:1", "2:2"]
+
+if __name__ == "__main__":
+    test_duplicated_verse_indexes_one_commentary_per_id()
+    test_concept_mentioning_a_verse_twice()
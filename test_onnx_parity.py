@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Test script checking the ONNX query encoder against the sentence-transformers model
+"""
+
+import os
+
+import numpy as np
+
+import main
+
+# int8 quantization costs a little precision; anything lower means a different embedding space
+MIN_COSINE = 0.98
+
+SAMPLE_QUERIES = [
+    "What is dharma?",
+    "How to achieve moksha?",
+    "Nature of the self",
+    "Karma yoga principles",
+]
+
+def test_onnx_matches_sentence_transformer():
+    """ONNX and PyTorch embeddings of the same queries point the same way"""
+    print("Testing ONNX / SentenceTransformer parity")
+    print("=" * 40)
+    if not main.ONNX_AVAILABLE or not os.path.isdir(main.ONNX_MODEL_DIR):
+        print(f"Skipped: no ONNX export at {main.ONNX_MODEL_DIR} (or optimum not installed)")
+        return
+
+    onnx_model = main.OnnxSentenceEncoder(main.ONNX_MODEL_DIR)
+    torch_model = main.SentenceTransformer(main.SENTENCE_MODEL, trust_remote_code=True, device="cpu")
+    print(f"ONNX pooling mode: {onnx_model.pooling_mode}")
+
+    onnx_embeddings = onnx_model.encode(SAMPLE_QUERIES, normalize_embeddings=True)
+    torch_embeddings = torch_model.encode(SAMPLE_QUERIES, normalize_embeddings=True, convert_to_numpy=True)
+    cosines = np.sum(onnx_embeddings * torch_embeddings, axis=1)
+    for query, cosine in zip(SAMPLE_QUERIES, cosines):
+        print(f"{cosine:.4f}  {query}")
+    assert cosines.min() >= MIN_COSINE, f"ONNX export does not match {main.SENTENCE_MODEL}"
+
+if __name__ == "__main__":
+    test_onnx_matches_sentence_transformer()